@@ -0,0 +1,596 @@
+# Parity checks and timings for the vectorized rewrites of the v3.py hot spots.
+# Run as `python benchmark.py [name ...]`; with no arguments every benchmark runs.
+# The legacy_* functions are copies of the original per-row code kept as the reference.
+# `suite` times the pipeline steps on synthetic data at several scales and appends the
+# results to bench_results.jsonl; `compare` puts the last two commits side by side.
+
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype
+
+import blend
+import cleaning
+import compact
+import enrich
+import features
+import forest
+import inference
+import store
+import submission
+import synthetic
+import weather
+
+
+def measure(fn, *args, **kwargs):
+    """Runs fn once and returns (result, wall seconds, peak traced MB)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def report(name, legacy_time, legacy_peak, new_time, new_peak):
+    print("{}: legacy {:.3f}s / {:.1f} MB, new {:.3f}s / {:.1f} MB, speedup {:.1f}x".format(
+        name, legacy_time, legacy_peak, new_time, new_peak, legacy_time / max(new_time, 1e-9)))
+
+
+def legacy_meteorological_features(df):
+    from meteocalc import feels_like
+
+    df['relative_humidity'] = 100 * (
+            np.exp((17.625 * df['dew_temperature']) / (243.04 + df['dew_temperature'])) / np.exp(
+        (17.625 * df['air_temperature']) / (243.04 + df['air_temperature'])))
+    flike = []
+    for i in range(len(df)):
+        at = df['air_temperature'][i]
+        rh = df['relative_humidity'][i]
+        ws = df['wind_speed'][i]
+        flike.append(feels_like(at, rh, ws).f)
+    df['feels_like'] = flike
+    return df
+
+
+def legacy_fill_weather_dataset(weather_df):
+    # v3.py's original gap filler; fillna(method='ffill') spelled .ffill() and the unused
+    # "week" column dropped so it still runs on current pandas. Shares the vectorized
+    # feels-like step so only the gap filling is compared.
+    import datetime
+
+    time_format = "%Y-%m-%d %H:%M:%S"
+    start_date = datetime.datetime.strptime(weather_df['timestamp'].min(), time_format)
+    end_date = datetime.datetime.strptime(weather_df['timestamp'].max(), time_format)
+    total_hours = int(((end_date - start_date).total_seconds() + 3600) / 3600)
+    hours_list = [(end_date - datetime.timedelta(hours=x)).strftime(time_format) for x in range(total_hours)]
+
+    for site_id in range(16):
+        site_hours = np.array(weather_df[weather_df['site_id'] == site_id]['timestamp'])
+        new_rows = pd.DataFrame(np.setdiff1d(hours_list, site_hours), columns=['timestamp'])
+        new_rows['site_id'] = site_id
+        weather_df = pd.concat([weather_df, new_rows])
+        weather_df = weather_df.reset_index(drop=True)
+
+    weather_df["datetime"] = pd.to_datetime(weather_df["timestamp"])
+    weather_df["day"] = weather_df["datetime"].dt.day
+    weather_df["month"] = weather_df["datetime"].dt.month
+    weather_df = weather_df.set_index(['site_id', 'day', 'month'])
+
+    for col in ['air_temperature', 'cloud_coverage', 'dew_temperature', 'sea_level_pressure',
+                'wind_direction', 'wind_speed', 'precip_depth_1_hr']:
+        filler = weather_df.groupby(['site_id', 'day', 'month'])[col].mean()
+        if col in ['cloud_coverage', 'sea_level_pressure', 'precip_depth_1_hr']:
+            filler = filler.ffill()
+        weather_df.update(pd.DataFrame(filler, columns=[col]), overwrite=False)
+
+    weather_df = weather_df.reset_index()
+    weather_df = weather_df.drop(['datetime', 'day', 'month'], axis=1)
+    return weather.get_meteorological_features(weather_df)
+
+def legacy_find_bad_zeros(X, y):
+    Xy = X.assign(meter_reading=y, meter_id=X.meter)
+    is_bad_zero = Xy.groupby(["building_id", "meter"]).apply(legacy_make_is_bad_zero)
+    return is_bad_zero[is_bad_zero].index.droplevel([0, 1])
+
+
+def legacy_make_is_bad_zero(Xy_subset, min_interval=48, summer_start=3000, summer_end=7500):
+    """Helper routine for 'find_bad_zeros'.
+    This operates upon a single dataframe produced by 'groupby'. We expect an
+    additional column 'meter_id' which is a duplicate of 'meter' because groupby
+    eliminates the original one."""
+    meter = Xy_subset.meter_id.iloc[0]
+    is_zero = Xy_subset.meter_reading == 0
+    if meter == 0:
+        # Electrical meters should never be zero. Keep all zero-readings in this table so that
+        # they will all be dropped in the train set.
+        return is_zero
+
+    transitions = (is_zero != is_zero.shift(1))
+    all_sequence_ids = transitions.cumsum()
+    ids = all_sequence_ids[is_zero].rename("ids")
+    if meter in [2, 3]:
+        # It's normal for steam and hotwater to be turned off during the summer
+        keep = set(ids[(Xy_subset.timestamp < summer_start) |
+                       (Xy_subset.timestamp > summer_end)].unique())
+        is_bad = ids.isin(keep) & (ids.map(ids.value_counts()) >= min_interval)
+    elif meter == 1:
+        time_ids = ids.to_frame().join(Xy_subset.timestamp).set_index("timestamp").ids
+        is_bad = ids.map(ids.value_counts()) >= min_interval
+
+        # Cold water may be turned off during the winter
+        jan_id = time_ids.get(0, False)
+        dec_id = time_ids.get(8283, False)
+        if (jan_id and dec_id and jan_id == time_ids.get(500, False) and
+                dec_id == time_ids.get(8783, False)):
+            is_bad = is_bad & (~(ids.isin(set([jan_id, dec_id]))))
+    else:
+        raise Exception(f"Unexpected meter type: {meter}")
+
+    result = is_zero.copy()
+    result.update(is_bad)
+    return result
+
+
+def synthetic_meter_readings(n_buildings=200, seed=0):
+    # a year of synthetic.generate() train readings (hour offsets as timestamp) plus chilled
+    # water switched off over the new year, which find_bad_zeros must keep
+    train = synthetic.generate(n_buildings, test_years=0, seed=seed)['train']
+    X = train[['building_id', 'meter']].assign(timestamp=store.to_hours(train['timestamp']),
+                                              site_id=train['building_id'] * 16 // n_buildings)
+    y = train['meter_reading'].astype(np.float64)
+    chilled = X.meter.to_numpy() == 1
+    for building in np.unique(X.building_id[chilled])[::3]:
+        off = chilled & (X.building_id.to_numpy() == building) & (
+            (X.timestamp.to_numpy() < 600) | (X.timestamp.to_numpy() >= synthetic.HOURS_PER_YEAR - 600))
+        y[off] = 0
+    return X, y
+
+
+def bench_bad_zeros(n_buildings=200):
+    X, y = synthetic_meter_readings(n_buildings)
+    legacy, legacy_time, legacy_peak = measure(legacy_find_bad_zeros, X, y)
+    new, new_time, new_peak = measure(cleaning.find_bad_zeros, X, y)
+    assert np.array_equal(np.sort(legacy.values), new.values)
+    report('find_bad_zeros ({} rows)'.format(len(X)), legacy_time, legacy_peak, new_time, new_peak)
+
+
+
+def random_weather(n_rows, seed=0):
+    # covers the wind chill, heat index and pass-through branches
+    rng = np.random.RandomState(seed)
+    df = pd.DataFrame({'air_temperature': rng.uniform(-30, 110, n_rows),
+                       'dew_temperature': rng.uniform(-35, 40, n_rows),
+                       'wind_speed': rng.uniform(0, 20, n_rows)})
+    df.loc[rng.rand(n_rows) < 0.01, 'air_temperature'] = np.nan
+    df.loc[rng.rand(n_rows) < 0.01, 'wind_speed'] = np.nan
+    return df
+
+
+def bench_feels_like(n_rows=20000):
+    df = random_weather(n_rows)
+    legacy, legacy_time, legacy_peak = measure(legacy_meteorological_features, df.copy())
+    new, new_time, new_peak = measure(weather.get_meteorological_features, df.copy())
+    for col in ['relative_humidity', 'feels_like']:
+        np.testing.assert_allclose(new[col].values, legacy[col].values.astype(np.float64), rtol=1e-9, atol=1e-9)
+    report('feels_like ({} rows)'.format(n_rows), legacy_time, legacy_peak, new_time, new_peak)
+
+
+def synthetic_weather_readings(n_hours=8784, seed=0):
+    # synthetic.generate() weather with timestamps as the strings of weather_*.csv
+    df = synthetic.generate(n_buildings=16, n_hours=n_hours, test_years=0, seed=seed)['weather_train']
+    df['timestamp'] = df['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S').astype(object)
+    return df
+
+
+def bench_fill_weather(paths=('weather_train.csv', 'weather_test.csv')):
+    frames = [(path, pd.read_csv(path)) for path in paths if os.path.exists(path)]
+    if not frames:
+        frames = [('synthetic', synthetic_weather_readings(n_hours=24 * 14))]
+    for name, df in frames:
+        legacy, legacy_time, legacy_peak = measure(legacy_fill_weather_dataset, df.copy())
+        new, new_time, new_peak = measure(weather.fill_weather_dataset, df.copy())
+        legacy = legacy.sort_values(['site_id', 'timestamp']).reset_index(drop=True)
+        pd.testing.assert_frame_equal(new[legacy.columns], legacy, check_dtype=False, rtol=1e-6)
+        report('fill_weather_dataset ({})'.format(name), legacy_time, legacy_peak, new_time, new_peak)
+
+
+def bench_enrich(n_buildings=1000, n_hours=8784):
+    # building and weather merges of v3.py against the JoinIndex gather
+    rng = np.random.RandomState(0)
+    # shuffled ids with gaps, so a building's id is not its row in the table
+    building_ids = rng.permutation(rng.choice(2 * n_buildings, n_buildings, replace=False)).astype(np.int16)
+    building_df = pd.DataFrame({'site_id': (np.arange(n_buildings) % 16).astype(np.int8),
+                                'building_id': building_ids,
+                                'square_feet': rng.randint(1000, 100000, n_buildings).astype(np.int32),
+                                'year_built': rng.uniform(1950, 2015, n_buildings).astype(np.float32)})
+    weather_df = synthetic.generate(n_buildings=16, n_hours=n_hours, test_years=0)['weather_train']
+    weather_df = weather.fill_weather_dataset(weather_df)
+    hours = pd.date_range('2016-01-01', periods=n_hours, freq=pd.Timedelta(hours=1)).values
+    n_rows = n_buildings * n_hours // 4
+    df = pd.DataFrame({'building_id': building_ids[rng.randint(0, n_buildings, n_rows)],
+                       'meter': rng.randint(0, 4, n_rows).astype(np.int8),
+                       'timestamp': hours[rng.randint(0, n_hours, n_rows)]})
+
+    def legacy_merge(df):
+        df = df.merge(building_df, left_on='building_id', right_on='building_id', how='left')
+        return df.merge(weather_df, how='left', left_on=['site_id', 'timestamp'], right_on=['site_id', 'timestamp'])
+
+    legacy, legacy_time, legacy_peak = measure(legacy_merge, df)
+    new, new_time, new_peak = measure(lambda df: enrich.JoinIndex(building_df, weather_df).enrich(df), df.copy())
+    pd.testing.assert_frame_equal(new[legacy.columns], legacy)
+    report('merge ({} rows)'.format(n_rows), legacy_time, legacy_peak, new_time, new_peak)
+
+
+def legacy_time_features(df):
+    # the datetime-based part of v3.py's features_engineering; holidays are given as
+    # Timestamps so isin() matches the way older pandas matched the date strings
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="%Y-%m-%d %H:%M:%S")
+    df["hour"] = df["timestamp"].dt.hour
+    df["weekend"] = df["timestamp"].dt.weekday
+    df['group'] = df['timestamp'].dt.month.replace({1: 1, 2: 1, 3: 1, 4: 1, 5: 2, 6: 2, 7: 2, 8: 2,
+                                                      9: 3, 10: 3, 11: 3, 12: 3})
+    df["is_holiday"] = (df.timestamp.isin(pd.to_datetime(features.holidays))).astype(int)
+    return df
+
+
+def bench_time_features(n_rows=2000000):
+    rng = np.random.RandomState(0)
+    hours = rng.randint(0, 3 * 8760, n_rows)
+    strings = pd.Series(pd.to_datetime(hours, unit='h', origin='2016-01-01').strftime("%Y-%m-%d %H:%M:%S"))
+    legacy, legacy_time, legacy_peak = measure(legacy_time_features, pd.DataFrame({'timestamp': strings}))
+    df = pd.DataFrame({'timestamp': hours.astype(np.int32), 'square_feet': 1.0, 'primary_use': 0})
+    new, new_time, new_peak = measure(features.features_engineering, df)
+    for col in ['hour', 'weekend', 'group', 'is_holiday']:
+        assert np.array_equal(new[col].values, legacy[col].values), col
+    report('time features ({} rows)'.format(n_rows), legacy_time, legacy_peak, new_time, new_peak)
+
+
+def legacy_grid_search(preds, target_l1p, combis):
+    # the blending notebook's loop, minus the per-iteration progress print
+    from sklearn.metrics import mean_squared_error
+
+    best_combi = []
+    for i, combi in enumerate(combis):
+        v = combi[0] * preds[:, 0] + combi[1] * preds[:, 1] + combi[2] * preds[:, 2]
+        curr_score = np.sqrt(mean_squared_error(np.log1p(v), target_l1p))
+        if not best_combi or curr_score < best_combi[0][1]:
+            best_combi[:] = [(i, curr_score)]
+    return best_combi[0]
+
+
+def bench_blend(n_rows=500000, n_combis=2000):
+    rng = np.random.RandomState(0)
+    truth = np.expm1(rng.uniform(0, 8, n_rows))
+    preds = np.column_stack([truth * rng.lognormal(0, s, n_rows) for s in (0.3, 0.4, 0.5)])
+    target_l1p = np.log1p(truth)
+    combis = rng.dirichlet(np.ones(3), n_combis) * rng.uniform(0.95, 1, (n_combis, 1))
+
+    (legacy_i, legacy_score), legacy_time, legacy_peak = measure(legacy_grid_search, preds, target_l1p, combis)
+    (new_i, new_score), new_time, new_peak = measure(blend.best_grid_weights, preds, target_l1p, combis)
+    assert np.isclose(new_score, legacy_score) and np.isclose(blend.blend_scores(preds, target_l1p, combis[legacy_i])[0], new_score)
+    report('blend grid ({} combinations)'.format(n_combis), legacy_time, legacy_peak, new_time, new_peak)
+
+    (weights, score), elapsed, peak = measure(blend.optimize_weights, preds, target_l1p, total=(0.95, 1))
+    print('blend simplex: {:.3f}s / {:.1f} MB, score {:.5f} (grid {:.5f}), weights {}'.format(
+        elapsed, peak, score, new_score, np.round(weights, 4)))
+
+
+def random_fold_models(n_rows=200000, n_features=12, n_folds=3, num_rounds=200, seed=0):
+    # small boosters on random data; only the prediction cost matters here
+    import lightgbm as lgb
+
+    rng = np.random.RandomState(seed)
+    X = pd.DataFrame(rng.rand(n_rows, n_features).astype(np.float32),
+                     columns=['f{}'.format(i) for i in range(n_features)])
+    y = np.log1p(np.abs(X.values @ rng.rand(n_features) + rng.normal(0, 0.1, n_rows)))
+    params = {'objective': 'regression', 'num_leaves': 63, 'learning_rate': 0.1, 'verbose': -1, 'seed': seed}
+    models = [lgb.train(dict(params, seed=seed + fold), lgb.Dataset(X.iloc[fold::n_folds], y[fold::n_folds]),
+                        num_rounds) for fold in range(n_folds)]
+    return models, X
+
+
+def bench_parallel_predict(workers=(1, 2, 4, 8)):
+    models, X = random_fold_models()
+    serial = inference.predict_folds(models, X, np.empty(len(X)))
+    for n in workers:
+        out, elapsed, _ = measure(inference.predict_folds, models, X, np.empty(len(X)), workers=n)
+        assert np.array_equal(out, serial)
+        print('predict_folds workers={}: {:.3f}s, {:,.0f} rows/sec'.format(n, elapsed, len(X) / elapsed))
+
+
+def legacy_reduce_mem_usage(df, use_float16=False):
+    # v3.py's reduce_mem_usage, without the memory printout
+    for col in df.columns:
+        if is_datetime64_any_dtype(df[col]) or isinstance(df[col].dtype, pd.CategoricalDtype):
+            continue
+        col_type = df[col].dtype
+        if col_type != object:
+            c_min = df[col].min()
+            c_max = df[col].max()
+            if str(col_type)[:3] == "int":
+                if c_min > np.iinfo(np.int8).min and c_max < np.iinfo(np.int8).max:
+                    df[col] = df[col].astype(np.int8)
+                elif c_min > np.iinfo(np.int16).min and c_max < np.iinfo(np.int16).max:
+                    df[col] = df[col].astype(np.int16)
+                elif c_min > np.iinfo(np.int32).min and c_max < np.iinfo(np.int32).max:
+                    df[col] = df[col].astype(np.int32)
+            else:
+                if use_float16 and c_min > np.finfo(np.float16).min and c_max < np.finfo(np.float16).max:
+                    df[col] = df[col].astype(np.float16)
+                elif c_min > np.finfo(np.float32).min and c_max < np.finfo(np.float32).max:
+                    df[col] = df[col].astype(np.float32)
+        else:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def legacy_compress_dataframe(df):
+    # v3.py's compress_dataframe
+    result = df.copy()
+    for col in result.columns:
+        col_data = result[col]
+        dn = col_data.dtype.name
+        if dn in ("object", "category"):
+            result[col] = pd.to_numeric(col_data.astype("category").cat.codes, downcast="integer")
+        elif dn == "bool":
+            result[col] = col_data.astype("int8")
+        elif dn.startswith("int") or (col_data.round() == col_data).all():
+            result[col] = pd.to_numeric(col_data, downcast="integer")
+        else:
+            result[col] = pd.to_numeric(col_data, downcast='float')
+    return result
+
+
+def fresh_merged_train(n_rows=2000000, seed=0):
+    # synthetic.generate() train merged with its buildings and weather, in the int64/float64/object
+    # dtypes of a fresh pandas load
+    n_buildings = -(-n_rows // (int(sum(synthetic.METER_RATES) * synthetic.HOURS_PER_YEAR) - 1000))
+    tables = synthetic.generate(n_buildings, test_years=0, seed=seed)
+    train = tables['train'].iloc[:n_rows].assign(timestamp=lambda df: store.to_hours(df['timestamp']))
+    df = enrich.JoinIndex(tables['building_metadata'], tables['weather_train']).enrich(train)
+    df = df[['building_id', 'meter', 'timestamp', 'meter_reading', 'square_feet', 'air_temperature', 'primary_use']]
+    return df.astype({'building_id': np.int64, 'meter': np.int64, 'timestamp': np.int64, 'meter_reading': np.float64,
+                      'square_feet': np.float64, 'air_temperature': np.float64, 'primary_use': object})
+
+
+def bench_compact(n_rows=2000000):
+    df = fresh_merged_train(n_rows)
+    path = os.path.join('cache', 'schemas', 'bench_compact.json')
+    if os.path.exists(path):
+        os.remove(path)
+
+    legacy, legacy_time, legacy_peak = measure(legacy_reduce_mem_usage, df.copy(), use_float16=True)
+    new, new_time, new_peak = measure(compact.compact, df.copy(), path, float16=True)
+    pd.testing.assert_frame_equal(new, legacy)
+    report('reduce_mem_usage ({} rows)'.format(n_rows), legacy_time, legacy_peak, new_time, new_peak)
+    new, new_time, new_peak = measure(compact.compact, df.copy(), path)
+    pd.testing.assert_frame_equal(new, legacy)
+    report('reduce_mem_usage, saved schema', legacy_time, legacy_peak, new_time, new_peak)
+
+    legacy, legacy_time, legacy_peak = measure(legacy_compress_dataframe, df)
+    new, new_time, new_peak = measure(compact.compact, df.copy(), integers=True)
+    # compress_dataframe kept fractional floats as float64 unless float32 was exact; compact
+    # always takes float32 there, so those columns only match to float32 precision
+    pd.testing.assert_frame_equal(new, legacy, check_dtype=False, rtol=1e-6)
+    assert (new.dtypes[new.dtypes != np.float32] == legacy.dtypes[new.dtypes != np.float32]).all()
+    report('compress_dataframe ({} rows)'.format(n_rows), legacy_time, legacy_peak, new_time, new_peak)
+
+
+def bench_flat_forest(n_rows=50000):
+    models, X = random_fold_models()
+    X = X.iloc[:n_rows]
+    (flat, flatten_time, _) = measure(forest.FlatForest.from_boosters, models)
+    legacy, legacy_time, legacy_peak = measure(inference.predict_folds, models, X, np.empty(len(X)))
+    new, new_time, new_peak = measure(flat.predict, X)
+    assert np.array_equal(new, legacy)
+    print('flattened {} trees in {:.2f}s'.format(len(flat.roots), flatten_time))
+    report('FlatForest vs boosters ({} rows)'.format(len(X)), legacy_time, legacy_peak, new_time, new_peak)
+
+
+def legacy_submission(path, row_id, meter_reading):
+    pd.DataFrame({'row_id': row_id, 'meter_reading': meter_reading}).to_csv(path, index=False, float_format='%.4f')
+
+
+def bench_submission(n_rows=2000000, seed=0):
+    rng = np.random.RandomState(seed)
+    row_id = np.arange(n_rows, dtype=np.int32)
+    meter_reading = np.exp(rng.normal(4, 2, n_rows))
+    meter_reading[rng.rand(n_rows) < 0.01] = 0
+
+    # leaked readings for a tenth of the rows, some of them missing
+    leak_row_id = rng.choice(n_rows, n_rows // 10, replace=False).astype(np.float64)
+    leak_reading = np.exp(rng.normal(4, 2, len(leak_row_id)))
+    leak_reading[rng.rand(len(leak_reading)) < 0.1] = np.nan
+    legacy = pd.DataFrame({'meter_reading': meter_reading}, index=row_id)
+    leak_df = pd.DataFrame({'meter_reading': leak_reading, 'row_id': leak_row_id}).set_index('row_id').dropna()
+    start = time.perf_counter()
+    legacy.loc[leak_df.index, 'meter_reading'] = leak_df['meter_reading']
+    legacy_time = time.perf_counter() - start
+    new = meter_reading.copy()
+    start = time.perf_counter()
+    submission.overwrite_leaks(new, row_id, leak_row_id, leak_reading)
+    new_time = time.perf_counter() - start
+    assert np.array_equal(new, legacy['meter_reading'].to_numpy())
+    print('leak overwrite ({} leaks): {:.3f}s -> {:.3f}s'.format(len(leak_df), legacy_time, new_time))
+
+    # readings a half away from rounding up (where rounding the scaled float can go the wrong way),
+    # infinities and values too large for the integer formatting path
+    new[:n_rows // 10] = (rng.randint(0, 10 ** 9, n_rows // 10) + 0.5) / 10 ** 4
+    new[-6:] = [np.inf, -np.inf, 1e15, -1e300, -0.0, 302.33275]
+
+    # timed without tracemalloc, which slows to_csv's per-row formatting down ten times over
+    start = time.perf_counter()
+    legacy_submission('bench_legacy.csv', row_id, new)
+    legacy_time = time.perf_counter() - start
+    start = time.perf_counter()
+    submission.write_submission('bench_new.csv', row_id, new)
+    new_time = time.perf_counter() - start
+    with open('bench_legacy.csv', 'rb') as f, open('bench_new.csv', 'rb') as g:
+        assert f.read() == g.read()
+    size = os.path.getsize('bench_new.csv') / 1024 ** 2
+    print('submission csv ({} rows, {:.0f} MB): {:.2f}s -> {:.2f}s, {:.0f} -> {:.0f} MB/s'.format(
+        n_rows, size, legacy_time, new_time, size / legacy_time, size / new_time))
+
+    for level in (1, 6):
+        start = time.perf_counter()
+        submission.write_submission('bench_new.csv.gz', row_id, new, compresslevel=level)
+        gz_time = time.perf_counter() - start
+        assert np.array_equal(pd.read_csv('bench_new.csv.gz')['row_id'].to_numpy(), row_id)
+        print('  gzip level {}: {:.2f}s, {:.0f} MB'.format(level, gz_time, os.path.getsize('bench_new.csv.gz') / 1024 ** 2))
+    for path in ('bench_legacy.csv', 'bench_new.csv', 'bench_new.csv.gz'):
+        os.remove(path)
+
+
+def legacy_read_submissions(paths, n_rows):
+    test_df = pd.DataFrame(index=pd.RangeIndex(n_rows))
+    for i, path in enumerate(paths):
+        test_df['pred{}'.format(i + 1)] = pd.read_csv(path, index_col=0).meter_reading
+    return test_df
+
+
+def bench_read_submissions(n_rows=2000000, n_files=3, seed=0):
+    rng = np.random.RandomState(seed)
+    paths = ['bench_submission{}.csv'.format(i) for i in range(n_files)]
+    for path in paths:
+        submission.write_submission(path, np.arange(n_rows), np.exp(rng.normal(4, 2, n_rows)))
+    cache_dir = os.path.join('cache', 'bench_submissions')
+    for path in paths:
+        if os.path.exists(submission.cache_path(path, cache_dir)):
+            os.remove(submission.cache_path(path, cache_dir))
+
+    legacy, legacy_time, legacy_peak = measure(legacy_read_submissions, paths, n_rows)
+    new, new_time, new_peak = measure(submission.read_submissions, paths, n_rows, cache_dir=cache_dir)
+    assert np.array_equal(new, legacy.to_numpy().astype(np.float32))
+    report('read {} submissions ({} rows)'.format(n_files, n_rows), legacy_time, legacy_peak, new_time, new_peak)
+    new, new_time, new_peak = measure(submission.read_submissions, paths, n_rows, cache_dir=cache_dir)
+    assert np.array_equal(new, legacy.to_numpy().astype(np.float32))
+    report('read {} submissions, cached'.format(n_files), legacy_time, legacy_peak, new_time, new_peak)
+    for path in paths:
+        os.remove(submission.cache_path(path, cache_dir))
+        os.remove(path)
+
+
+def time_best(fn, setup, repeat=3):
+    """Best wall time of fn(*setup()) over repeat runs, plus the traced peak MB of one more run.
+    setup() builds fresh inputs outside the timed region, since several steps modify their input."""
+    best = float('inf')
+    for _ in range(repeat):
+        args = setup()
+        start = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - start)
+    _, _, peak = measure(fn, *setup())
+    return best, peak
+
+
+def pipeline_steps(tables):
+    """(name, rows, fn, setup) for every hot step of v3.py, on synthetic.generate() tables."""
+    import lightgbm as lgb
+
+    building_df = tables['building_metadata']
+    weather_df = weather.fill_weather_dataset(tables['weather_train'].copy())
+    train_df = tables['train'].copy()
+    train_df['timestamp'] = store.to_hours(train_df['timestamp'])
+    merged = enrich.JoinIndex(building_df, weather_df).enrich(train_df.copy())
+    X = train_df.drop(columns='meter_reading').assign(site_id=merged['site_id'])
+    y = train_df['meter_reading']
+
+    # a few small fold models on the engineered features; only their prediction is timed
+    train_features = features.features_engineering(merged.copy()).drop(columns=['meter_reading', 'group'])
+    models = [lgb.train({'objective': 'regression', 'num_leaves': 63, 'verbose': -1, 'seed': fold},
+                        lgb.Dataset(train_features.iloc[fold::3], np.log1p(y.iloc[fold::3])), 50)
+              for fold in range(3)]
+    test_df = tables['test'].drop(columns='row_id')
+    test_df['timestamp'] = store.to_hours(test_df['timestamp'])
+    test_weather = weather.fill_weather_dataset(tables['weather_test'].copy())
+    test_features = features.features_engineering(enrich.JoinIndex(building_df, test_weather).enrich(test_df))
+    test_features = test_features[train_features.columns]
+
+    return [
+        ('fill_weather_dataset', len(tables['weather_train']), weather.fill_weather_dataset,
+         lambda: (tables['weather_train'].copy(),)),
+        ('merge', len(train_df), lambda df: enrich.JoinIndex(building_df, weather_df).enrich(df),
+         lambda: (train_df.copy(),)),
+        ('find_bad_rows', len(X), cleaning.find_bad_rows, lambda: (X, y)),
+        ('features_engineering', len(merged), features.features_engineering, lambda: (merged.copy(),)),
+        ('compress_dataframe', len(merged), lambda df: compact.compact(df, integers=True), lambda: (merged.copy(),)),
+        ('predictions', len(test_features), inference.predict_folds,
+         lambda: (models, test_features, np.empty(len(test_features)))),
+    ]
+
+
+def git_commit():
+    here = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=here, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=here,
+                               capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return commit + ('-dirty' if dirty else '')
+
+
+RESULTS = 'bench_results.jsonl'
+
+
+def bench_suite(scales=('small', 'medium'), repeat=3, results_path=RESULTS):
+    """Times every pipeline step at each synthetic.SCALES scale and appends the results to
+    results_path, tagged with the current commit, for `python benchmark.py compare`."""
+    commit = git_commit()
+    for scale in scales:
+        tables = synthetic.generate(**synthetic.SCALES[scale])
+        for name, rows, fn, setup in pipeline_steps(tables):
+            seconds, peak = time_best(fn, setup, repeat)
+            print('{} {}: {:.3f}s, {:,.0f} rows/sec, peak {:.1f} MB'.format(scale, name, seconds, rows / seconds, peak))
+            with open(results_path, 'a') as f:
+                f.write(json.dumps({'commit': commit, 'scale': scale, 'bench': name, 'rows': rows,
+                                    'seconds': seconds, 'peak_mb': peak, 'recorded': time.time()}) + '\n')
+
+
+def compare_results(results_path=RESULTS):
+    """Latest result per step for the last two commits in results_path, side by side."""
+    if not os.path.exists(results_path):
+        print('no results in', results_path)
+        return
+    with open(results_path) as f:
+        results = [json.loads(line) for line in f if line.strip()]
+    commits = list(dict.fromkeys(r['commit'] for r in results))[-2:]
+    latest = {(r['commit'], r['scale'], r['bench']): r for r in results}
+    print('{:<8} {:<22} '.format('scale', 'bench') + ' '.join('{:>14}'.format(c) for c in commits) + '   ratio')
+    for scale, bench in dict.fromkeys((r['scale'], r['bench']) for r in results):
+        times = [latest.get((c, scale, bench), {}).get('seconds') for c in commits]
+        line = '{:<8} {:<22} '.format(scale, bench) + ' '.join(
+            '{:>13.3f}s'.format(t) if t is not None else '{:>14}'.format('-') for t in times)
+        if len(times) == 2 and None not in times:
+            line += '   {:.2f}x'.format(times[0] / times[1])
+        print(line)
+
+
+BENCHMARKS = {
+    'feels_like': bench_feels_like,
+    'fill_weather': bench_fill_weather,
+    'bad_zeros': bench_bad_zeros,
+    'enrich': bench_enrich,
+    'time_features': bench_time_features,
+    'parallel_predict': bench_parallel_predict,
+    'blend': bench_blend,
+    'compact': bench_compact,
+    'flat_forest': bench_flat_forest,
+    'submission': bench_submission,
+    'read_submissions': bench_read_submissions,
+    'suite': bench_suite,
+    'compare': compare_results,
+}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or list(BENCHMARKS):
+        BENCHMARKS[name]()
@@ -0,0 +1,56 @@
+import numpy as np
+from scipy.optimize import minimize
+
+# Blend weight search on the leak rows. preds is an (n_rows, n_models) matrix of
+# meter_reading predictions and target_l1p the log1p of the leaked readings, computed
+# once. Scores are the same log-RMSE the blending notebook used.
+
+
+def blend_scores(preds, target_l1p, weights, max_elements=2 ** 24):
+    """log-RMSE of every weight vector (row of weights), evaluated as chunked matrix products."""
+    preds = np.asarray(preds, dtype=np.float64)
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+    chunk = max(1, max_elements // len(preds))
+    scores = np.empty(len(weights))
+    for start in range(0, len(weights), chunk):
+        blended = preds @ weights[start: start + chunk].T  # (n_rows, chunk)
+        np.log1p(blended, out=blended)
+        blended -= target_l1p[:, None]
+        np.square(blended, out=blended)
+        scores[start: start + chunk] = np.sqrt(blended.mean(axis=0))
+    return scores
+
+
+def best_grid_weights(preds, target_l1p, weights):
+    """Returns (index, score) of the best row of weights."""
+    scores = blend_scores(preds, target_l1p, weights)
+    best = int(np.argmin(scores))
+    return best, scores[best]
+
+
+def optimize_weights(preds, target_l1p, x0=None, total=(1, 1)):
+    """Minimizes log-RMSE over the simplex with SLSQP: weights >= 0 and, by default,
+    summing to exactly 1. total=(low, high) relaxes the sum to a range, e.g. the
+    (0.95, 1) band the grid search covers.
+
+    Returns (weights, score)."""
+    preds = np.asarray(preds, dtype=np.float64)
+    n_models = preds.shape[1]
+    if x0 is None:
+        x0 = np.full(n_models, 1. / n_models)
+
+    def loss(w):
+        blended = preds @ w
+        residual = np.log1p(blended) - target_l1p
+        mse = np.mean(residual ** 2)
+        grad = 2 * preds.T @ (residual / (1 + blended)) / len(residual)
+        return mse, grad
+
+    low, high = total
+    if low == high:
+        constraints = [{'type': 'eq', 'fun': lambda w: w.sum() - low, 'jac': np.ones_like}]
+    else:
+        constraints = [{'type': 'ineq', 'fun': lambda w: w.sum() - low, 'jac': np.ones_like},
+                       {'type': 'ineq', 'fun': lambda w: high - w.sum(), 'jac': lambda w: -np.ones_like(w)}]
+    result = minimize(loss, x0, jac=True, method='SLSQP', bounds=[(0, 1)] * n_models, constraints=constraints)
+    return result.x, np.sqrt(result.fun)
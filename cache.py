@@ -0,0 +1,112 @@
+import hashlib
+import inspect
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.feather as feather
+
+
+def _source(obj):
+    try:
+        return inspect.getsource(obj).encode()
+    except (OSError, TypeError):
+        # no source file (e.g. defined in a REPL): fall back to the compiled code
+        return obj.__code__.co_code + repr(obj.__code__.co_consts).encode()
+
+
+class StageCache:
+    """Content-addressed cache for the DataFrame-producing stages of the pipeline.
+
+    Every stage is keyed on a hash of its input files, the source of the stage
+    function (plus any helpers or modules listed in deps), its parameters and the
+    keys of the stages it reads from, so editing one step only reruns that step and
+    whatever sits downstream of it. Outputs are stored as uncompressed Feather files
+    which are memory-mapped on load, and the least recently used files are evicted
+    once the directory grows past max_bytes.
+
+        cache = StageCache('cache')
+        cache.stage('weather', prepare_weather, inputs=['weather_train.csv'], path='weather_train.csv')
+        cache.stage('merged', merge_train, inputs=['train.csv'], after=['weather'])
+        train_df = cache.get('merged')
+    """
+
+    def __init__(self, root='cache', max_bytes=40 * 1024 ** 3):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.stages = {}
+        os.makedirs(root, exist_ok=True)
+        self._digests_path = os.path.join(root, 'digests.json')
+        self._digests = {}
+        if os.path.exists(self._digests_path):
+            with open(self._digests_path) as f:
+                self._digests = json.load(f)
+
+    def stage(self, name, fn, inputs=(), after=(), deps=(), **params):
+        """Registers a stage; fn is called as fn(*outputs of after, **params) on a miss."""
+        h = hashlib.sha256()
+        h.update(name.encode())
+        h.update(_source(StageCache._save))  # files written in an older format are not reused
+        for obj in [fn] + list(deps):
+            h.update(_source(obj))
+        h.update(repr(sorted(params.items())).encode())
+        for path in inputs:
+            h.update(self._file_digest(path).encode())
+        for upstream in after:
+            h.update(self.stages[upstream]['key'].encode())
+        key = h.hexdigest()[:16]
+        self.stages[name] = {'fn': fn, 'after': list(after), 'params': params, 'key': key,
+                             'path': os.path.join(self.root, '{}-{}.feather'.format(name, key))}
+        return key
+
+    def get(self, name):
+        stage = self.stages[name]
+        if os.path.exists(stage['path']):
+            print('{}: loading cached {}'.format(name, stage['path']))
+            os.utime(stage['path'])  # mark as recently used
+            return self._load(stage['path'])
+
+        print('{}: building'.format(name))
+        df = stage['fn'](*[self.get(upstream) for upstream in stage['after']], **stage['params'])
+        self._save(df, stage['path'])
+        self._evict(keep=stage['path'])
+        return df
+
+    def _file_digest(self, path):
+        # hashing the raw CSVs is slow, so digests are remembered per (size, mtime)
+        st = os.stat(path)
+        stamp = '{}:{}'.format(st.st_size, st.st_mtime_ns)
+        entry = self._digests.get(os.path.abspath(path))
+        if entry and entry[0] == stamp:
+            return entry[1]
+
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(16 * 1024 ** 2), b''):
+                h.update(chunk)
+        self._digests[os.path.abspath(path)] = [stamp, h.hexdigest()]
+        with open(self._digests_path, 'w') as f:
+            json.dump(self._digests, f)
+        return h.hexdigest()
+
+    @staticmethod
+    def _save(df, path):
+        # float16 columns are stored as Arrow halffloat, so they load back without a cast
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        feather.write_feather(table, path + '.tmp', compression='uncompressed')
+        os.replace(path + '.tmp', path)
+
+    @staticmethod
+    def _load(path):
+        return feather.read_table(path, memory_map=True).to_pandas(split_blocks=True, self_destruct=True)
+
+    def _evict(self, keep):
+        files = [os.path.join(self.root, f) for f in os.listdir(self.root) if f.endswith('.feather')]
+        files.sort(key=os.path.getmtime)
+        total = sum(os.path.getsize(f) for f in files)
+        for path in files:
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                total -= os.path.getsize(path)
+                os.remove(path)
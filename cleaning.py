@@ -0,0 +1,68 @@
+import numpy as np
+
+
+def find_bad_zeros(X, y, min_interval=48, summer_start=3000, summer_end=7500):
+    """Returns an Index object containing only the rows which should be deleted.
+
+    Run-length encodes the zero readings of every (building_id, meter) series at once
+    instead of calling groupby.apply once per series. The rules are the same:
+    electrical zeros are always bad, other zero runs are bad once they last
+    min_interval hours, except steam/hotwater runs that stay inside the summer and
+    cold water runs that span the new year."""
+    building = X.building_id.to_numpy()
+    meter = X.meter.to_numpy()
+    timestamp = X.timestamp.to_numpy()
+    is_zero = np.asarray(y) == 0
+
+    unexpected = ~np.isin(meter, [0, 1, 2, 3])
+    if unexpected.any():
+        raise Exception(f"Unexpected meter type: {meter[unexpected][0]}")
+
+    # stable sort keeps the original row order inside every series
+    order = np.lexsort((meter, building))
+    building, meter, timestamp, is_zero = building[order], meter[order], timestamp[order], is_zero[order]
+
+    new_series = np.ones(len(order), dtype=bool)
+    new_series[1:] = (building[1:] != building[:-1]) | (meter[1:] != meter[:-1])
+    new_run = new_series.copy()
+    new_run[1:] |= is_zero[1:] != is_zero[:-1]
+    series_id = np.cumsum(new_series) - 1
+    run_id = np.cumsum(new_run) - 1
+    long_run = (np.bincount(run_id) >= min_interval)[run_id]
+
+    # It's normal for steam and hotwater to be turned off during the summer
+    off_season = (timestamp < summer_start) | (timestamp > summer_end)
+    keep_run = np.bincount(run_id, weights=off_season & is_zero) > 0
+
+    # Cold water may be turned off during the winter: ignore the January and December runs
+    # when the same run covers hours 0 and 500, and another covers 8283 and 8783
+    def run_at(hour):
+        at_hour = np.full(series_id[-1] + 1 if len(order) else 0, -1)
+        hit = is_zero & (timestamp == hour)
+        at_hour[series_id[hit]] = run_id[hit]
+        return at_hour
+
+    jan_id, dec_id = run_at(0), run_at(8283)
+    winter = (jan_id >= 0) & (dec_id >= 0) & (jan_id == run_at(500)) & (dec_id == run_at(8783))
+    winter_run = np.zeros(len(keep_run), dtype=bool)
+    winter_run[jan_id[winter]] = True
+    winter_run[dec_id[winter]] = True
+
+    is_bad = np.where(meter == 0, True,
+                      np.where(meter == 1, long_run & ~winter_run[run_id], long_run & keep_run[run_id]))
+    is_bad &= is_zero
+    return X.index[np.sort(order[is_bad])]
+
+
+def find_bad_sitezero(X):
+    """Returns indices of bad rows from the early days of Site 0 (UCF)."""
+    return X[(X.timestamp < 3378) & (X.site_id == 0) & (X.meter == 0)].index
+
+
+def find_bad_building1099(X, y):
+    """Returns indices of bad rows (with absurdly high readings) from building 1099."""
+    return X[(X.building_id == 1099) & (X.meter == 2) & (y > 3e4)].index
+
+
+def find_bad_rows(X, y):
+    return find_bad_zeros(X, y).union(find_bad_sitezero(X)).union(find_bad_building1099(X, y))
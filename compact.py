@@ -0,0 +1,168 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_numeric_dtype
+
+# Schema-driven dtype compaction, replacing reduce_mem_usage and compress_dataframe.
+# infer_schema() scans every column once, in cache-sized chunks, for its min, max and
+# (optionally) whether it only holds whole numbers, and picks the narrowest dtype.
+# apply_schema() converts column by column into a preallocated array of that dtype,
+# chunk by chunk, so no full-size float64 temporaries are made. A schema saved with
+# compact(df, path) is applied as-is on later calls without rescanning; a column whose
+# new values no longer fit is re-inferred and the file updated.
+#
+#     train_df = compact(train_df, 'cache/schemas/train.json', float16=True)
+
+CHUNK_ROWS = 1 << 20
+
+FLOAT16_MAX = float(np.finfo(np.float16).max)  # larger magnitudes overflow to inf
+FLOAT32_MAX = float(np.finfo(np.float32).max)
+
+
+def _int_dtype(lo, hi):
+    for dtype in (np.int8, np.int16, np.int32):
+        info = np.iinfo(dtype)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(dtype).name
+    return 'int64'
+
+
+def _float_dtype(lo, hi, float16):
+    if np.isnan(lo):  # all missing
+        return 'float16' if float16 else 'float32'
+    if float16 and -FLOAT16_MAX <= lo and hi <= FLOAT16_MAX:
+        return 'float16'
+    if -FLOAT32_MAX <= lo and hi <= FLOAT32_MAX:
+        return 'float32'
+    return 'float64'
+
+
+def column_stats(values, integers=False, chunk_rows=CHUNK_ROWS):
+    """(min, max, whole) of a numeric array in one chunked pass; NaNs are ignored by min and max,
+    whole is only computed with integers=True and is False as soon as a NaN or fraction shows up."""
+    lo, hi, whole = np.nan, np.nan, integers
+    is_float = values.dtype.kind == 'f'
+    for start in range(0, len(values), chunk_rows):
+        chunk = values[start: start + chunk_rows]
+        lo = np.fmin(lo, np.fmin.reduce(chunk))
+        hi = np.fmax(hi, np.fmax.reduce(chunk))
+        if whole and is_float:
+            whole = bool((np.round(chunk) == chunk).all())
+    return float(lo), float(hi), whole
+
+
+def infer_column(series, float16=False, integers=False, chunk_rows=CHUNK_ROWS):
+    """Schema entry for one column.
+
+    integers=True is the old compress_dataframe behaviour: whole-number floats become ints
+    and strings or categories become integer codes. Otherwise strings become categories."""
+    if is_datetime64_any_dtype(series):
+        return {'dtype': series.dtype.name}
+    if isinstance(series.dtype, pd.CategoricalDtype) or not is_numeric_dtype(series):
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            categories = series.cat.categories.tolist()
+        else:
+            categories = pd.Index(pd.unique(series.to_numpy())).dropna().sort_values().tolist()
+        if not integers:
+            return {'dtype': 'category', 'categories': categories}
+        return {'dtype': _int_dtype(-1, len(categories) - 1), 'categories': categories}
+    if is_bool_dtype(series):
+        return {'dtype': 'int8'}
+
+    values = series.to_numpy()
+    lo, hi, whole = column_stats(values, integers, chunk_rows)
+    if values.dtype.kind in 'iu' or whole:
+        return {'dtype': _int_dtype(lo, hi)}
+    return {'dtype': _float_dtype(lo, hi, float16)}
+
+
+def infer_schema(df, float16=False, integers=False, chunk_rows=CHUNK_ROWS):
+    schema = {col: infer_column(df[col], float16, integers, chunk_rows) for col in df.columns}
+    return {'float16': float16, 'integers': integers, 'columns': schema}
+
+
+def _convert(series, entry, chunk_rows):
+    """series converted to the entry's dtype, or None if some value does not fit."""
+    if 'categories' in entry:
+        # factorize, then map the distinct values onto the stored categories
+        codes, uniques = pd.factorize(series)
+        lookup = pd.Index(entry['categories']).get_indexer(uniques)
+        if (lookup < 0).any():
+            return None  # a value outside the stored categories
+        codes = np.append(lookup, -1).astype(_int_dtype(-1, len(entry['categories']) - 1))[codes]
+        if entry['dtype'] == 'category':
+            return pd.Categorical.from_codes(codes, categories=entry['categories'])
+        return codes.astype(entry['dtype'])
+
+    dtype = np.dtype(entry['dtype'])
+    values = series.to_numpy()
+    if values.dtype == dtype:
+        return values
+    out = np.empty(len(values), dtype=dtype)
+    for start in range(0, len(values), chunk_rows):
+        chunk = values[start: start + chunk_rows]
+        converted = out[start: start + chunk_rows]
+        with np.errstate(over='ignore', invalid='ignore'):
+            converted[:] = chunk
+        # the cast must give back the same numbers (float targets only lose precision)
+        if dtype.kind == 'f':
+            if (np.isinf(converted) & ~np.isinf(chunk)).any():
+                return None
+        elif not (converted == chunk).all():
+            return None
+    return out
+
+
+def apply_schema(df, schema, chunk_rows=CHUNK_ROWS):
+    """Converts df's columns to the schema in place. Columns missing from the schema, or
+    whose values no longer fit it, are re-inferred and the schema updated; their names
+    are returned."""
+    changed = []
+    for col in df.columns:
+        entry = schema['columns'].get(col)
+        if entry is not None and 'categories' not in entry and df[col].dtype.name == entry['dtype']:
+            continue
+        converted = None if entry is None else _convert(df[col], entry, chunk_rows)
+        if converted is None:
+            entry = infer_column(df[col], schema['float16'], schema['integers'], chunk_rows)
+            schema['columns'][col] = entry
+            changed.append(col)
+            converted = _convert(df[col], entry, chunk_rows)
+        df[col] = converted
+    return changed
+
+
+def load_schema(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_schema(schema, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(schema, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def compact(df, path=None, float16=False, integers=False, chunk_rows=CHUNK_ROWS):
+    """Shrinks df's dtypes in place and returns it.
+
+    With a path the schema is read from it if it exists (no scan) and written to it
+    otherwise, so the test path and later runs pick the same dtypes as the first run."""
+    start_mem = df.memory_usage().sum() / 1024 ** 2
+    if path is not None and os.path.exists(path):
+        schema = load_schema(path)
+        changed = apply_schema(df, schema, chunk_rows)
+        if changed:
+            print('re-inferred {} for {}'.format(changed, path))
+            save_schema(schema, path)
+    else:
+        schema = infer_schema(df, float16, integers, chunk_rows)
+        apply_schema(df, schema, chunk_rows)
+        if path is not None:
+            save_schema(schema, path)
+    end_mem = df.memory_usage().sum() / 1024 ** 2
+    print('Memory usage {:.2f} MB -> {:.2f} MB'.format(start_mem, end_mem))
+    return df
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_float_dtype
+
+import store
+
+
+class JoinIndex:
+    """Precomputed lookup that replaces the building_id and (site_id, timestamp) merges.
+
+    building_id maps straight to a row of the building table, and since the weather
+    covers 16 sites on an hourly grid, (site_id, hour offset) maps to a weather row
+    through a dense 2-D position table. enrich() then fills every column with one
+    integer gather instead of hashing string keys and copying the whole frame.
+
+        index = JoinIndex(building_df, weather_df)
+        train_df = index.enrich(train_df)
+    """
+
+    def __init__(self, building_df, weather_df):
+        building_ids = building_df['building_id'].to_numpy()
+        self.building_pos = np.full(building_ids.max() + 1, -1, dtype=np.int32)
+        self.building_pos[building_ids] = np.arange(len(building_df))
+        self.building_site = building_df['site_id'].to_numpy()  # by row of the building table
+        self.building_cols = {col: building_df[col] for col in building_df.columns if col != 'building_id'}
+
+        sites = weather_df['site_id'].to_numpy().astype(np.int64)
+        hours = store.hour_offsets(weather_df['timestamp']).astype(np.int64)
+        self.hour0 = hours.min()
+        self.weather_pos = np.full((sites.max() + 1, hours.max() - self.hour0 + 1), -1, dtype=np.int32)
+        self.weather_pos[sites, hours - self.hour0] = np.arange(len(weather_df))
+        self.weather_cols = {col: weather_df[col] for col in weather_df.columns if col not in ('site_id', 'timestamp')}
+
+    def building_rows(self, building_id):
+        building_id = np.asarray(building_id, dtype=np.int64)
+        known = (building_id >= 0) & (building_id < len(self.building_pos))
+        return np.where(known, self.building_pos[np.where(known, building_id, 0)], -1)
+
+    def weather_rows(self, building_rows, timestamp):
+        site = np.where(building_rows >= 0, self.building_site[building_rows], -1).astype(np.int64)
+        offset = store.hour_offsets(timestamp).astype(np.int64) - self.hour0
+        n_sites, n_hours = self.weather_pos.shape
+        known = (site >= 0) & (site < n_sites) & (offset >= 0) & (offset < n_hours)
+        return np.where(known, self.weather_pos[np.where(known, site, 0), np.where(known, offset, 0)], -1)
+
+    def enrich(self, df):
+        """Adds the building and weather columns to df in place, like the two left merges did."""
+        building_rows = self.building_rows(df['building_id'].to_numpy())
+        weather_rows = self.weather_rows(building_rows, df['timestamp'])
+        for col, source in self.building_cols.items():
+            df[col] = _gather(source, building_rows)
+        for col, source in self.weather_cols.items():
+            df[col] = _gather(source, weather_rows)
+        return df
+
+
+def _gather(source, rows):
+    """source[rows] into a freshly allocated typed column; rows == -1 become missing values."""
+    missing = rows < 0
+    if isinstance(source.dtype, pd.CategoricalDtype):
+        codes = np.append(source.cat.codes.to_numpy(), np.int8(-1)).astype(source.cat.codes.dtype)
+        return pd.Categorical.from_codes(np.take(codes, rows, mode='wrap'), dtype=source.dtype)
+
+    values = source.to_numpy()
+    if not is_float_dtype(values) and missing.any():
+        # a left merge upcasts int columns with unmatched rows the same way
+        values = values.astype(np.float64)
+    sentinel = np.nan if is_float_dtype(values) else 0
+    values = np.append(values, np.array([sentinel], dtype=values.dtype))
+    out = np.empty(len(rows), dtype=values.dtype)
+    np.take(values, rows, out=out, mode='wrap')  # wrap sends rows == -1 to the sentinel
+    return out
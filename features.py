@@ -0,0 +1,53 @@
+import gc
+
+import numpy as np
+from pandas.api.types import is_numeric_dtype
+from sklearn.preprocessing import LabelEncoder
+
+import store
+
+# Time features come from lookup tables indexed by hour offset (hours since 2016-01-01,
+# see store.to_hours), so the train and test paths never parse or compare date strings.
+
+holidays = ["2016-01-01", "2016-01-18", "2016-02-15", "2016-05-30", "2016-07-04",
+            "2016-09-05", "2016-10-10", "2016-11-11", "2016-11-24", "2016-12-26",
+            "2017-01-02", "2017-01-16", "2017-02-20", "2017-05-29", "2017-07-04",
+            "2017-09-04", "2017-10-09", "2017-11-10", "2017-11-23", "2017-12-25",
+            "2018-01-01", "2018-01-15", "2018-02-19", "2018-05-28", "2018-07-04",
+            "2018-09-03", "2018-10-08", "2018-11-12", "2018-11-22", "2018-12-25",
+            "2019-01-01"]
+
+FIRST_HOUR = -24 * 7  # a week of slack for the GMT-shifted hours just before 2016
+_hours = np.arange(FIRST_HOUR, 4 * 8784)  # through 2019
+_times = store.EPOCH + _hours.astype('timedelta64[h]')
+_months = _times.astype('datetime64[M]').astype(np.int64) % 12 + 1
+
+HOUR = (_hours % 24).astype(np.int8)
+WEEKDAY = ((_hours // 24 + 4) % 7).astype(np.int8)  # 2016-01-01 was a Friday
+GROUP = ((_months - 1) // 4 + 1).astype(np.int8)  # Jan-Apr, May-Aug, Sep-Dec
+# the old isin() against date strings only ever matched the midnight reading, and so does this
+IS_HOLIDAY = np.isin(_times, np.array(holidays, dtype='datetime64[ns]')).astype(np.int8)
+del _hours, _times, _months
+
+
+def features_engineering(df):
+    # Add more features
+    idx = store.hour_offsets(df["timestamp"]) - FIRST_HOUR
+    df["hour"] = HOUR[idx]
+    df["weekend"] = WEEKDAY[idx]
+    df['group'] = GROUP[idx]
+    df["is_holiday"] = IS_HOLIDAY[idx]
+    df['square_feet'] = np.log1p(df['square_feet'])
+
+    # Remove Unused Columns
+    drop = ["timestamp"]
+    df = df.drop(drop, axis=1)
+    gc.collect()
+
+    # Encode Categorical Data (skipped when the building table was encoded up front,
+    # as the chunked test path does so every chunk gets the same codes)
+    if not is_numeric_dtype(df["primary_use"]):
+        le = LabelEncoder()
+        df["primary_use"] = le.fit_transform(df["primary_use"])
+
+    return df
@@ -0,0 +1,200 @@
+import numpy as np
+import pandas as pd
+
+# The fold boosters flattened into one set of node arrays, evaluated with NumPy.
+# Every tree of every fold is parsed once from Booster.dump_model(); a chunk of rows
+# then walks all trees at once, one level per step, as flat (tree, row) index arrays,
+# and the per-fold sums go through expm1 and the fold mean in the same pass. The
+# arrays can be saved with np.savez and loaded without lightgbm. Predictions match
+# Booster.predict bit for bit but take about three times as long (benchmark.py
+# flat_forest), so v3.py keeps predicting with the boosters.
+#
+#     forest = FlatForest.from_boosters(models)
+#     meter_reading = forest.predict(test_df[features])
+
+# objectives whose prediction is the raw score
+RAW_OBJECTIVES = ('regression', 'regression_l1', 'huber', 'fair', 'quantile', 'mape')
+
+ZERO_THRESHOLD = 1e-35  # kZeroThreshold, below which LightGBM treats a value as zero
+
+MISSING_TYPES = {'None': 0, 'Zero': 1, 'NaN': 2}
+
+ARRAYS = ['feature', 'threshold', 'left', 'right', 'default_left', 'missing_type', 'is_categorical',
+          'cat_offset', 'cat_size', 'cat_bits', 'value', 'roots', 'fold']
+
+
+class FlatForest:
+    def __init__(self, arrays, n_folds, n_features):
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        self.n_folds = int(n_folds)
+        self.n_features = int(n_features)
+
+    @classmethod
+    def from_boosters(cls, models):
+        """Flattens the trees each booster predicts with (up to its best iteration)."""
+        nodes = {name: [] for name in ['feature', 'threshold', 'left', 'right', 'default_left', 'missing_type',
+                                       'is_categorical', 'cat_offset', 'cat_size', 'value']}
+        cat_bits, roots, folds = [], [], []
+        cat_total = [0]
+        n_features = None
+
+        def add(node):
+            # leaves point at themselves, so extra steps past the leaf leave rows where they are
+            i = len(nodes['feature'])
+            for values in nodes.values():
+                values.append(0)
+            nodes['threshold'][i] = np.inf
+            if 'leaf_value' in node:
+                nodes['left'][i] = nodes['right'][i] = i
+                nodes['value'][i] = node['leaf_value']
+                return i
+            nodes['feature'][i] = node['split_feature']
+            nodes['default_left'][i] = node['default_left']
+            nodes['missing_type'][i] = MISSING_TYPES[node['missing_type']]
+            if node['decision_type'] == '==':
+                categories = [int(c) for c in str(node['threshold']).split('||')]
+                bits = np.zeros(max(categories) + 1, dtype=bool)
+                bits[categories] = True
+                nodes['is_categorical'][i] = True
+                nodes['cat_offset'][i] = cat_total[0]
+                nodes['cat_size'][i] = len(bits)
+                cat_bits.append(bits)
+                cat_total[0] += len(bits)
+            else:
+                nodes['threshold'][i] = node['threshold']
+            nodes['left'][i] = add(node['left_child'])
+            nodes['right'][i] = add(node['right_child'])
+            return i
+
+        for fold, model in enumerate(models):
+            dump = model.dump_model()
+            if dump['objective'].split()[0] not in RAW_OBJECTIVES or dump['num_tree_per_iteration'] != 1:
+                raise ValueError('FlatForest only supports single-output regression, not ' + dump['objective'])
+            if n_features is None:
+                n_features = dump['max_feature_idx'] + 1
+            for tree in dump['tree_info']:
+                if 'leaf_value' not in tree['tree_structure'] and 'split_feature' not in tree['tree_structure']:
+                    raise ValueError('unsupported tree (linear trees are not flattened)')
+                roots.append(add(tree['tree_structure']))
+                folds.append(fold)
+
+        arrays = {'feature': np.array(nodes['feature'], dtype=np.int32),
+                  'threshold': np.array(nodes['threshold'], dtype=np.float64),
+                  'left': np.array(nodes['left'], dtype=np.int32),
+                  'right': np.array(nodes['right'], dtype=np.int32),
+                  'default_left': np.array(nodes['default_left'], dtype=bool),
+                  'missing_type': np.array(nodes['missing_type'], dtype=np.int8),
+                  'is_categorical': np.array(nodes['is_categorical'], dtype=bool),
+                  'cat_offset': np.array(nodes['cat_offset'], dtype=np.int32),
+                  'cat_size': np.array(nodes['cat_size'], dtype=np.int32),
+                  'cat_bits': np.concatenate(cat_bits + [np.zeros(1, dtype=bool)]),
+                  'value': np.array(nodes['value'], dtype=np.float64),
+                  'roots': np.array(roots, dtype=np.int32),
+                  'fold': np.array(folds, dtype=np.int32)}
+        return cls(arrays, len(models), n_features)
+
+    def save(self, path):
+        np.savez(path, n_folds=self.n_folds, n_features=self.n_features,
+                 **{name: getattr(self, name) for name in ARRAYS})
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls({name: f[name] for name in ARRAYS}, f['n_folds'], f['n_features'])
+
+    def _prepare(self):
+        # per-node lookups the walk uses: children side by side, the side NaN and zero go to
+        is_leaf = self.left == np.arange(len(self.left))
+        missing_default = np.where(self.is_categorical, False, self.default_left)
+        self._children = np.stack([self.right, self.left], axis=1).ravel().astype(np.int32)  # [2 * node + go_left]
+        self._is_leaf = is_leaf
+        # NaN: the default side when NaN is the missing value (or, as 0, is the zero missing value),
+        # otherwise it counts as 0; categorical splits always send it right
+        self._nan_left = np.where(self.missing_type == 0, 0 <= self.threshold, missing_default)
+        self._nan_left &= ~self.is_categorical
+        self._zero_missing = self.missing_type == 1
+        self._any_zero_missing = bool(self._zero_missing.any())
+        self._any_categorical = bool(self.is_categorical.any())
+
+    def _leaves(self, X):
+        """(trees, rows) leaf node of every row of X in every tree.
+
+        Pairs are laid out tree by tree, so consecutive pairs read the same nodes and, through
+        the transposed X, neighbouring values of the same feature. Only pairs that have not
+        reached a leaf take the next step."""
+        if not hasattr(self, '_children'):
+            self._prepare()
+        n_rows = len(X)
+        columns = np.ascontiguousarray(X.T).ravel()  # feature-major
+        leaves = np.repeat(self.roots, n_rows)
+        pair = np.flatnonzero(~self._is_leaf[leaves]).astype(np.int32)
+        node = leaves[pair]
+        row = pair % n_rows
+        while len(pair):
+            x = columns[self.feature[node] * n_rows + row]
+            go_left = x <= self.threshold[node]
+            is_nan = np.isnan(x)
+            if is_nan.any():
+                go_left[is_nan] = self._nan_left[node[is_nan]]
+            if self._any_zero_missing:
+                zero = self._zero_missing[node] & (np.abs(x) <= ZERO_THRESHOLD)
+                go_left[zero] = self.default_left[node[zero]]
+            if self._any_categorical:
+                cat = np.flatnonzero(self.is_categorical[node])
+                if len(cat):
+                    # categories go left when their bit is set; NaN, negatives and unseen values go
+                    # right whatever the missing type; the int cast truncates like C++
+                    cat_node, cat_x = node[cat], x[cat]
+                    category = np.clip(np.trunc(np.where(np.isnan(cat_x), -1, cat_x)), -1, 2 ** 31 - 1).astype(np.int32)
+                    known = (category >= 0) & (category < self.cat_size[cat_node])
+                    bit = self.cat_bits[np.where(known, self.cat_offset[cat_node] + category, len(self.cat_bits) - 1)]
+                    go_left[cat] = known & bit
+
+            node = self._children[2 * node + go_left]
+            # leaves are their own children, so finished pairs can keep stepping until
+            # enough of them have piled up to be worth dropping
+            done = self._is_leaf[node]
+            n_done = np.count_nonzero(done)
+            if n_done == len(done) or n_done > len(done) // 4:
+                leaves[pair[done]] = node[done]
+                pair, node, row = pair[~done], node[~done], row[~done]
+        return leaves.reshape(len(self.roots), n_rows)
+
+    def raw_scores(self, X, max_elements=2 ** 22):
+        """(rows, folds) raw score of every fold; trees are added in boosting order, as LightGBM does."""
+        X = _matrix(X)
+        scores = np.zeros((self.n_folds, len(X)))
+        chunk = max(1, max_elements // max(1, len(self.roots)))
+        for start in range(0, len(X), chunk):
+            values = self.value[self._leaves(X[start: start + chunk])]
+            out = scores[:, start: start + chunk]
+            for tree, fold in enumerate(self.fold):
+                out[fold] += values[tree]
+        return scores.T
+
+    def predict(self, X, out=None, max_elements=2 ** 22):
+        """Mean of expm1(fold raw score), the same quantity inference.predict_folds computes."""
+        X = _matrix(X)
+        if out is None:
+            out = np.empty(len(X))
+        chunk = max(1, max_elements // max(1, len(self.roots)))
+        for start in range(0, len(X), chunk):
+            scores = self.raw_scores(X[start: start + chunk], max_elements)
+            np.expm1(scores, out=scores)
+            out[start: start + chunk] = scores.mean(axis=1)
+        return out
+
+
+def _codes(series):
+    codes = series.cat.codes.to_numpy().astype(np.float32)
+    codes[codes < 0] = np.nan
+    return codes
+
+
+def _matrix(X):
+    # one contiguous float32 matrix; category columns by their codes, missing as NaN, as LightGBM reads them
+    if isinstance(X, pd.DataFrame):
+        X = np.column_stack([_codes(X[col]) if isinstance(X[col].dtype, pd.CategoricalDtype)
+                             else X[col].to_numpy() for col in X.columns])
+    return np.ascontiguousarray(X, dtype=np.float32)
@@ -0,0 +1,94 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+import store
+from enrich import JoinIndex
+from features import features_engineering
+from forest import FlatForest
+from submission import SubmissionWriter
+
+
+def predict_folds(models, X, out, workers=1, batch_rows=100000, predict_threads=None):
+    """Writes the mean of expm1(fold predictions) for X into the preallocated out array.
+
+    With workers > 1 every (row batch, fold model) pair becomes a task on a thread
+    pool; Booster.predict releases the GIL, and all tasks read the same feature
+    array. The folds are still summed in model order, so the result is bit-for-bit
+    the serial one. models can also be a FlatForest, which does the whole average itself."""
+    if isinstance(models, FlatForest):
+        return models.predict(X, out)
+    if workers <= 1:
+        out[:] = 0
+        for model in models:
+            out += np.expm1(model.predict(X))
+        out /= len(models)
+        return out
+
+    if isinstance(X, pd.DataFrame):
+        # the same conversion lightgbm applies to a DataFrame, done once up front
+        X = X.to_numpy(dtype=np.result_type(*X.dtypes))
+    if predict_threads is None:
+        predict_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    fold_preds = np.empty((len(models), len(X)))
+
+    def predict_task(fold, pos):
+        fold_preds[fold, pos: pos + batch_rows] = np.expm1(
+            models[fold].predict(X[pos: pos + batch_rows], num_threads=predict_threads))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        tasks = [pool.submit(predict_task, fold, pos)
+                 for pos in range(0, len(X), batch_rows) for fold in range(len(models))]
+        for task in tasks:
+            task.result()
+
+    out[:] = 0
+    for preds in fold_preds:
+        out += preds
+    out /= len(models)
+    return out
+
+
+def predict_batches(models, X, iterations=50, workers=1, batch_rows=100000, predict_threads=None):
+    # split test data into batches
+    set_size = len(X)
+    batch_size = -(-set_size // iterations)
+    meter_reading = np.empty(set_size)
+    for pos in tqdm(range(0, set_size, batch_size)):
+        predict_folds(models, X.iloc[pos: pos + batch_size], meter_reading[pos: pos + batch_size], workers,
+                      batch_rows, predict_threads)
+    return meter_reading
+
+
+def predict_stream(models, features, weather_df, building_df, path='submission.csv', chunk_rows=1000000,
+                   workers=1, batch_rows=100000, predict_threads=None):
+    """Streams test rows from the store through enrichment, features_engineering and the fold models.
+
+    Only one chunk of test rows is materialized at a time, joined through a JoinIndex
+    built once for the whole run, and its predictions are appended to path straight
+    away, so peak memory scales with chunk_rows rather than with the 41M-row test set.
+    A path ending in .gz is written gzip-compressed."""
+    table = store.open_table('test')
+    building_df = building_df.copy()
+    if not pd.api.types.is_numeric_dtype(building_df['primary_use']):
+        building_df['primary_use'] = building_df['primary_use'].astype('category').cat.codes
+    index = JoinIndex(building_df, weather_df)
+
+    meter_reading = np.empty(chunk_rows)
+    with SubmissionWriter(path) as writer:
+        for start in tqdm(range(0, table.num_rows, chunk_rows)):
+            test_df = table.slice(start, chunk_rows).to_pandas()
+            row_ids = test_df.pop('row_id').to_numpy()
+            test_df['timestamp'] = store.to_hours(test_df['timestamp'])
+            test_df = index.enrich(test_df)
+            test_df = features_engineering(test_df)
+
+            out = predict_folds(models, test_df[features], meter_reading[:len(test_df)], workers,
+                                batch_rows, predict_threads)
+            np.clip(out, a_min=0, a_max=None, out=out)  # clip min at zero
+            writer.write(row_ids, out)
+    print('We are done!')
@@ -0,0 +1,87 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+import store
+
+# Leaked test-period readings, stored as one Feather partition per site. Every
+# partition is sorted by a (building_id, meter, timestamp) key, so adding or fixing a
+# site only rewrites that site's file and re-ingested rows replace the old ones.
+# Rules about which rows to use are applied when reading, not baked into the files.
+
+ROOT = 'leak_store'
+COLUMNS = ['building_id', 'meter', 'timestamp', 'meter_reading']
+
+# 13 and 14 disagree with the train readings, 245 is missing from the site 2 source
+EXCLUDED_BUILDINGS = (13, 14, 245)
+
+
+def leak_keys(building_id, meter, timestamp):
+    """int64 key, unique per (building_id, meter, hour)."""
+    series = np.asarray(building_id, dtype=np.int64) * 4 + np.asarray(meter, dtype=np.int64)
+    return (series << 20) | (store.to_hours(timestamp).astype(np.int64) + (1 << 19))
+
+
+def partition_path(site_id, root=ROOT):
+    return os.path.join(root, 'site{}.feather'.format(site_id))
+
+
+def empty_partition():
+    return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in
+                         [('key', 'int64'), ('building_id', 'int16'), ('meter', 'int8'),
+                          ('timestamp', 'datetime64[ns]'), ('meter_reading', 'float32')]})
+
+
+def read_partition(site_id, root=ROOT):
+    path = partition_path(site_id, root)
+    if not os.path.exists(path):
+        return empty_partition()
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+
+def upsert(site_id, df, root=ROOT):
+    """Merges df into the site's partition; rows with an existing key overwrite the stored ones."""
+    df = pd.DataFrame({'building_id': df['building_id'].to_numpy().astype(np.int16),
+                       'meter': df['meter'].to_numpy().astype(np.int8),
+                       'timestamp': pd.to_datetime(df['timestamp']).to_numpy(),
+                       'meter_reading': df['meter_reading'].to_numpy().astype(np.float32)})
+    df.insert(0, 'key', leak_keys(df.building_id, df.meter, df.timestamp))
+
+    existing = read_partition(site_id, root)
+    existing = existing[~np.isin(existing['key'].to_numpy(), df['key'].to_numpy())]
+    # within df itself the last occurrence of a key wins
+    df = pd.concat([existing, df.drop_duplicates('key', keep='last')], ignore_index=True)
+    df = df.sort_values('key', kind='mergesort').reset_index(drop=True)
+
+    os.makedirs(root, exist_ok=True)
+    path = partition_path(site_id, root)
+    df.to_feather(path + '.tmp', compression='uncompressed')
+    os.replace(path + '.tmp', path)
+    print('site {}: {} rows'.format(site_id, len(df)))
+
+
+def stored_sites(root=ROOT):
+    if not os.path.isdir(root):
+        return []
+    return sorted(int(f[4:-8]) for f in os.listdir(root) if f.startswith('site') and f.endswith('.feather'))
+
+
+def load(root=ROOT, sites=None, exclude_buildings=EXCLUDED_BUILDINGS, start_year=2017, end_year=2018):
+    """All leak rows of the given sites, minus excluded buildings and years outside [start_year, end_year];
+    NaN and negative readings come back as 0."""
+    if not os.path.isdir(root):
+        # a wrong path would otherwise look like a store without leaks
+        raise FileNotFoundError('no leak store at {}'.format(root))
+    parts = []
+    for site_id in stored_sites(root) if sites is None else sites:
+        df = read_partition(site_id, root)
+        years = df.timestamp.dt.year
+        keep = (~df.building_id.isin(exclude_buildings)) & (years >= start_year) & (years <= end_year)
+        parts.append(df.loc[keep, COLUMNS])
+    if not parts:  # nothing ingested yet
+        return empty_partition()[COLUMNS]
+    df = pd.concat(parts, ignore_index=True)
+    df.loc[~(df.meter_reading > 0), 'meter_reading'] = 0  # NaN compares False
+    return df
@@ -0,0 +1,184 @@
+import collections
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Per-stage instrumentation for v3.py and blending. Every stage records wall and CPU
+# time, peak and change in RSS, rows in and out and the size of its output, and the
+# run is written as one JSON report under profiles/ so runs can be diffed.
+# trace_allocations=True adds tracemalloc's peak of bytes allocated (slow), and
+# sample_interval starts a sampling profiler whose stacks are written in collapsed
+# "frame;frame;frame count" form next to the report, ready for flamegraph.pl or speedscope.
+#
+#     profiler = Profiler('v3')
+#     prepare = profiler.wrap(prepare_weather)          # or
+#     with profiler.stage('predict') as record:
+#         ...
+#         record['rows_out'] = len(submission)
+#     profiler.write()
+
+
+# the highest peak seen so far; Profiler stages reset the kernel's peak, ru_maxrss included
+_peak_mb = 0.0
+
+
+def peak_rss_mb():
+    """Peak RSS of the process in MB, including peaks from before any stage reset."""
+    global _peak_mb
+    # ru_maxrss is in KB on Linux
+    _peak_mb = max(_peak_mb, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, _status_mb('VmHWM') or 0)
+    return _peak_mb
+
+
+def _status_mb(field):
+    # VmRSS / VmHWM from /proc, None where there is no procfs
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def _reset_peak_rss():
+    # writing 5 to clear_refs resets VmHWM and ru_maxrss (Linux 4.0+), which gives every stage
+    # its own peak; returns the VmHWM from before the reset, or None where it cannot be reset
+    peak = _status_mb('VmHWM')
+    peak_rss_mb()  # keep the process-wide peak
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return peak
+    except OSError:
+        return None
+
+
+def _rows(obj):
+    if hasattr(obj, 'shape') and len(getattr(obj, 'shape')):
+        return int(obj.shape[0])
+    return None
+
+
+def _nbytes(obj):
+    if hasattr(obj, 'memory_usage'):
+        return int(obj.memory_usage(deep=False).sum())
+    return getattr(obj, 'nbytes', None)
+
+
+class Sampler(threading.Thread):
+    """Samples the main thread's stack every interval seconds, counted per stage."""
+
+    def __init__(self, profiler, interval):
+        super().__init__(daemon=True)
+        self.profiler = profiler
+        self.interval = interval
+        self.counts = collections.Counter()
+        self.main_id = threading.main_thread().ident
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.main_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('{}:{}'.format(os.path.basename(code.co_filename), code.co_name))
+                frame = frame.f_back
+            stages = [record['name'] for record in self.profiler.open_stages]
+            self.counts[';'.join(stages + stack[::-1])] += 1
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.counts.most_common():
+                f.write('{} {}\n'.format(stack, count))
+
+
+class Profiler:
+    def __init__(self, run_name, report_dir='profiles', trace_allocations=False, sample_interval=None):
+        self.run_name = run_name
+        self.report_dir = report_dir
+        self.trace_allocations = trace_allocations
+        self.started = time.time()
+        self.records = []
+        self.open_stages = []
+        self.sampler = None
+        if sample_interval:
+            self.sampler = Sampler(self, sample_interval)
+            self.sampler.start()
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """Times the block; set record['rows_out'] / record['bytes_out'] inside it if known."""
+        parent = self.open_stages[-1] if self.open_stages else None
+        record = {'name': name, 'parent': parent['name'] if parent else None,
+                  'rows_in': rows_in, 'rows_out': None, 'bytes_out': None, 'child_peak_rss_mb': 0}
+        self.open_stages.append(record)
+        if self.trace_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if self.trace_allocations:
+            tracemalloc.reset_peak()
+        rss_start = _status_mb('VmRSS')
+        peak_before = _reset_peak_rss()
+        per_stage_peak = peak_before is not None
+        if parent is not None and per_stage_peak:
+            # the reset wipes the peak the parent has reached so far, so it is folded in like a child's
+            parent['child_peak_rss_mb'] = max(parent['child_peak_rss_mb'], peak_before)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = time.perf_counter() - wall
+            record['cpu_s'] = time.process_time() - cpu
+            peak = _status_mb('VmHWM') if per_stage_peak else peak_rss_mb()
+            # a nested stage resets the high-water mark, so fold its peak back in
+            record['peak_rss_mb'] = max(peak or 0, record.pop('child_peak_rss_mb'))
+            rss_end = _status_mb('VmRSS')
+            record['rss_delta_mb'] = None if rss_start is None else rss_end - rss_start
+            if self.trace_allocations:
+                record['allocated_peak_mb'] = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+            self.open_stages.pop()
+            if parent is not None:
+                parent['child_peak_rss_mb'] = max(parent['child_peak_rss_mb'], record['peak_rss_mb'])
+            self.records.append(record)
+            print('[{}] {:.1f}s wall, {:.1f}s cpu, peak RSS {:.0f} MB, rows {} -> {}'.format(
+                name, record['wall_s'], record['cpu_s'], record['peak_rss_mb'], record['rows_in'], record['rows_out']))
+
+    def wrap(self, fn, name=None):
+        """fn timed as a stage; rows_in is the length of the first argument with one, rows_out
+        and bytes_out come from the result. functools.wraps keeps fn's source visible to StageCache."""
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            rows_in = next((r for r in map(_rows, args) if r is not None), None)
+            with self.stage(name or fn.__name__, rows_in) as record:
+                result = fn(*args, **kwargs)
+                record['rows_out'] = _rows(result)
+                record['bytes_out'] = _nbytes(result)
+            return result
+
+        return wrapper
+
+    def write(self):
+        """Writes profiles/<run>-<start time>.json (and .folded with the sampler) and returns its path."""
+        os.makedirs(self.report_dir, exist_ok=True)
+        path = os.path.join(self.report_dir, '{}-{}.json'.format(
+            self.run_name, time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started))))
+        report = {'run': self.run_name, 'started': self.started, 'wall_s': time.time() - self.started,
+                  'cpu_count': os.cpu_count(), 'python': sys.version.split()[0],
+                  'peak_rss_mb': max([peak_rss_mb()] + [r['peak_rss_mb'] for r in self.records]),
+                  'stages': self.records}
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=1)
+        if self.sampler is not None:
+            self.sampler.stopped.set()
+            self.sampler.join()
+            self.sampler.write(path[:-len('.json')] + '.folded')
+        print('profile written to', path)
+        return path
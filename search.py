@@ -0,0 +1,123 @@
+import json
+import multiprocessing
+import os
+import pickle
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import training
+
+# Random hyperparameter search over run_lgbm's parameters. Trials run in a process
+# pool with a fixed thread budget each, all reading the same binary Dataset, and a
+# trial is pruned once one of its folds scores worse than the median of the finished
+# trials on that fold. Every result is appended to a JSON-lines file, so an
+# interrupted search picks up where it stopped.
+#
+# The workers are spawned, which re-imports the __main__ module in each of them, so
+# search() itself needs a caller behind an `if __name__ == '__main__':` guard. Scripts
+# without one, like v3.py, use search_process(), which runs it as `python search.py`.
+
+RESULTS = 'search_results.jsonl'
+
+
+def read_results(path=RESULTS):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def sample_params(space, n_trials, seed=0):
+    """space maps a parameter to a list of choices, an (int, int) range or a (float, float) range."""
+    rng = np.random.RandomState(seed)
+    trials = []
+    for _ in range(n_trials):
+        params = {}
+        for name, values in space.items():
+            if isinstance(values, list):
+                params[name] = values[rng.randint(len(values))]
+            elif all(isinstance(v, int) for v in values):
+                params[name] = int(rng.randint(values[0], values[1] + 1))
+            else:
+                params[name] = float(rng.uniform(values[0], values[1]))
+        trials.append(params)
+    return trials
+
+
+def save_folds(path, splits, n_rows):
+    """Stores the fold of every row so trials can rebuild the splits without pickling them."""
+    fold_of_row = np.full(n_rows, -1, dtype=np.int8)
+    for fold, (_, val_idx) in enumerate(splits):
+        fold_of_row[val_idx] = fold
+    np.save(path, fold_of_row)
+
+
+def run_trial(params, dataset_path, folds_path, num_rounds, early_stopping_rounds, results_path, min_trials):
+    start = time.time()
+    dataset = training.cached_dataset(dataset_path)
+    fold_of_row = np.load(folds_path, mmap_mode='r')
+    splits = [(np.flatnonzero(fold_of_row != fold), np.flatnonzero(fold_of_row == fold))
+              for fold in range(fold_of_row.max() + 1)]
+
+    def should_prune(fold, score):
+        finished = [r['fold_scores'][fold] for r in read_results(results_path) if r['status'] == 'complete']
+        return len(finished) >= min_trials and score > np.median(finished)
+
+    _, scores = training.train_folds(dataset, splits, params, num_rounds, early_stopping_rounds,
+                                     verbose_eval=0, after_fold=should_prune)
+    return {'params': params, 'fold_scores': [float(s) for s in scores], 'score': float(np.mean(scores)),
+            'status': 'complete' if len(scores) == len(splits) else 'pruned', 'wall_time': time.time() - start}
+
+
+def search(space, dataset_path, folds_path, base_params, n_trials=20, workers=2, threads_per_trial=4,
+           num_rounds=20000, early_stopping_rounds=50, results_path=RESULTS, min_trials=3, seed=0):
+    """Runs the trials not yet in results_path and returns the best complete result."""
+    # every trial gets the same thread budget, whatever the base params asked for
+    base_params = {k: v for k, v in base_params.items() if k not in ('n_jobs', 'num_threads')}
+    # a trial is recognised by its params without the thread budget, so a rerun with other
+    # workers or on another machine still skips the trials already recorded
+    def trial_key(params):
+        return json.dumps({k: v for k, v in params.items() if k != 'num_threads'}, sort_keys=True)
+
+    done = {trial_key(r['params']) for r in read_results(results_path)}
+    trials = [dict(base_params, **params, num_threads=threads_per_trial)
+              for params in sample_params(space, n_trials, seed)]
+    trials = [params for params in trials if trial_key(params) not in done]
+    print('{} trials to run, {} already in {}'.format(len(trials), n_trials - len(trials), results_path))
+
+    # spawn, not fork: forking a process that already has OpenMP threads can hang lightgbm
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = [pool.submit(run_trial, params, dataset_path, folds_path, num_rounds, early_stopping_rounds,
+                               results_path, min_trials) for params in trials]
+        for future in as_completed(futures):
+            result = future.result()
+            with open(results_path, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+            print('{status} trial: score {score:.5f} in {wall_time:.0f}s'.format(**result), result['params'])
+
+    return best_result(results_path)
+
+
+def best_result(results_path=RESULTS):
+    complete = [r for r in read_results(results_path) if r['status'] == 'complete']
+    return min(complete, key=lambda r: r['score'])
+
+
+def search_process(space, dataset_path, folds_path, base_params, results_path=RESULTS, **kwargs):
+    """search() in a python process of its own; same arguments and result."""
+    config_path = results_path + '.args.pkl'
+    with open(config_path, 'wb') as f:
+        # pickled rather than JSON, which would turn the (low, high) ranges of space into choice lists
+        pickle.dump(dict(kwargs, space=space, dataset_path=dataset_path, folds_path=folds_path,
+                         base_params=base_params, results_path=results_path), f)
+    subprocess.run([sys.executable, os.path.abspath(__file__), config_path], check=True)
+    return best_result(results_path)
+
+
+if __name__ == '__main__':
+    with open(sys.argv[1], 'rb') as f:
+        search(**pickle.load(f))
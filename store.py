@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as csv
+import pyarrow.feather as feather
+from pandas.api.types import is_integer_dtype
+
+# One place that turns the ASHRAE CSVs into typed Feather files and opens them again.
+# Every input is parsed exactly once, straight into its final (already downcast)
+# dtypes, and later reads are memory-mapped with only the requested columns.
+
+WEATHER_SCHEMA = {'site_id': pa.int8(), 'timestamp': pa.timestamp('ns'),
+                  'air_temperature': pa.float32(), 'cloud_coverage': pa.float32(),
+                  'dew_temperature': pa.float32(), 'precip_depth_1_hr': pa.float32(),
+                  'sea_level_pressure': pa.float32(), 'wind_direction': pa.float32(),
+                  'wind_speed': pa.float32()}
+
+SCHEMAS = {
+    'train': {'building_id': pa.int16(), 'meter': pa.int8(), 'timestamp': pa.timestamp('ns'),
+              'meter_reading': pa.float32()},
+    'test': {'row_id': pa.int32(), 'building_id': pa.int16(), 'meter': pa.int8(),
+             'timestamp': pa.timestamp('ns')},
+    'building_metadata': {'site_id': pa.int8(), 'building_id': pa.int16(), 'primary_use': pa.string(),
+                          'square_feet': pa.int32(), 'year_built': pa.float32(), 'floor_count': pa.float32()},
+    'weather_train': WEATHER_SCHEMA,
+    'weather_test': WEATHER_SCHEMA,
+    'sample_submission': {'row_id': pa.int32(), 'meter_reading': pa.float32()},
+}
+
+# timestamps as hours since the start of the train year, same as read_train() used
+EPOCH = np.datetime64('2016-01-01T00:00:00', 'ns')
+
+CSV_DIR = '.'
+STORE_DIR = 'store'
+
+
+def convert(name, csv_dir=CSV_DIR, store_dir=STORE_DIR):
+    """Parses <csv_dir>/<name>.csv into <store_dir>/<name>.feather using SCHEMAS."""
+    schema = SCHEMAS[name]
+    table = csv.read_csv(os.path.join(csv_dir, name + '.csv'),
+                         convert_options=csv.ConvertOptions(column_types=schema,
+                                                            timestamp_parsers=['%Y-%m-%d %H:%M:%S']))
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    del table
+    for col, dtype in schema.items():
+        if dtype == pa.string():
+            # sorted categories give the same codes as LabelEncoder / astype('category')
+            df[col] = df[col].astype(pd.CategoricalDtype(sorted(df[col].dropna().unique())))
+
+    os.makedirs(store_dir, exist_ok=True)
+    path = os.path.join(store_dir, name + '.feather')
+    df.to_feather(path + '.tmp', compression='uncompressed')
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def open_table(name, columns=None, csv_dir=CSV_DIR, store_dir=STORE_DIR):
+    """Memory-maps the stored table, converting the CSV first if it has not been done yet."""
+    path = os.path.join(store_dir, name + '.feather')
+    if not os.path.exists(path):
+        convert(name, csv_dir, store_dir)
+    return feather.read_table(path, columns=columns, memory_map=True)
+
+
+def to_hours(timestamp):
+    return ((np.asarray(timestamp, dtype='datetime64[ns]') - EPOCH) // np.timedelta64(1, 'h')).astype(np.int32)
+
+
+def hour_offsets(timestamp):
+    """int32 hour offsets; int columns already are (load(..., hours=True)), anything else is parsed."""
+    if is_integer_dtype(timestamp):
+        return np.asarray(timestamp, dtype=np.int32)
+    return to_hours(pd.to_datetime(timestamp))
+
+
+def load(name, columns=None, hours=False, csv_dir=CSV_DIR, store_dir=STORE_DIR):
+    """Returns the stored table as a DataFrame; hours=True gives int32 hour offsets for timestamp."""
+    df = open_table(name, columns, csv_dir, store_dir).to_pandas(split_blocks=True, self_destruct=True)
+    if hours and 'timestamp' in df.columns:
+        df['timestamp'] = to_hours(df['timestamp'])
+    return df
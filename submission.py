@@ -0,0 +1,172 @@
+import gzip
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from pyarrow import csv
+
+# Submission output for v3.py and blending. Leaked readings are scattered straight into
+# the prediction array by row_id, and the CSV is formatted chunk by chunk with pyarrow
+# compute kernels on a thread pool (they release the GIL) instead of DataFrame.to_csv.
+# Paths ending in .gz are gzip-compressed on the way out: every chunk is compressed on
+# its thread as a gzip member of its own, and concatenated members are one valid .gz file.
+# Earlier submissions are read back in parallel, meter_reading only, into one float32
+# matrix by row_id; each parsed file is kept as .npy under cache/submissions, keyed by
+# the CSV's path, size and mtime, so a rerun maps it back instead of parsing it again.
+#
+#     preds = read_submissions(['a/submission.csv', 'b/submission.csv'], n_rows)
+#     overwrite_leaks(meter_reading, row_id, leak_df['row_id'], leak_df['meter_reading'])
+#     write_submission('submission.csv.gz', row_id, meter_reading)
+
+HEADER = b'row_id,meter_reading\n'
+
+CACHE_DIR = os.path.join('cache', 'submissions')
+
+
+def overwrite_leaks(meter_reading, row_id, leak_row_id, leak_reading):
+    """Replaces meter_reading (in place) at the rows whose row_id has a leaked reading;
+    leak rows with a missing row_id or reading are skipped. Returns the number written."""
+    row_id = np.asarray(row_id)
+    leak_row_id = np.asarray(leak_row_id, dtype=np.float64)
+    leak_reading = np.asarray(leak_reading, dtype=np.float64)
+    keep = ~np.isnan(leak_reading) & (leak_row_id >= 0) & (leak_row_id <= row_id.max())  # NaN compares False
+    leak_row_id, leak_reading = leak_row_id[keep].astype(np.int64), leak_reading[keep]
+
+    if row_id[0] == 0 and (np.diff(row_id) == 1).all():
+        position = leak_row_id  # row_id is the row number, as in sample_submission.csv
+    else:
+        lookup = np.full(row_id.max() + 1, -1, dtype=np.int64)
+        lookup[row_id] = np.arange(len(row_id))
+        position = lookup[leak_row_id]
+        keep = position >= 0
+        position, leak_reading = position[keep], leak_reading[keep]
+    meter_reading[position] = leak_reading
+    return len(position)
+
+
+def format_rows(row_id, meter_reading, decimals=4):
+    """'row_id,meter_reading\\n' lines as one bytes-like buffer, the same bytes as
+    to_csv(float_format='%.<decimals>f') gives; NaN is an empty field."""
+    values = np.asarray(meter_reading, dtype=np.float64)
+    is_nan = np.isnan(values)
+    with np.errstate(invalid='ignore'):
+        scaled = np.abs(values) * 10 ** decimals
+        half = np.abs(scaled - np.floor(scaled) - 0.5)
+        # rint can round the product the other way from the exact value when the product is
+        # within its rounding error of a half, and the int64 cast breaks past 2 ** 53 (and on
+        # inf); those rows are formatted by Python, which rounds the exact binary value
+        exact = (scaled >= 2 ** 53) | (half <= scaled * 2 ** -52)
+    scaled = np.rint(np.where(is_nan | exact, 0, scaled)).astype(np.int64)
+    integer = pc.cast(pa.array(scaled // 10 ** decimals), pa.string())
+    if decimals:
+        fraction = pc.utf8_lpad(pc.cast(pa.array(scaled % 10 ** decimals), pa.string()), decimals, '0')
+        integer = pc.binary_join_element_wise(integer, fraction, '.')
+    reading = pc.if_else(pa.array(np.signbit(values)), pc.binary_join_element_wise('-', integer, ''), integer)
+    reading = pc.if_else(pa.array(is_nan), '', reading)
+    if exact.any():
+        reading = pc.replace_with_mask(reading, pa.array(exact),
+                                       pa.array(['%.*f' % (decimals, value) for value in values[exact]]))
+
+    lines = pc.binary_join_element_wise(pc.cast(pa.array(np.asarray(row_id)), pa.string()), reading, ',')
+    lines = pc.binary_join_element_wise(lines, '', '\n')
+    offsets = np.frombuffer(lines.buffers()[1], dtype=np.int32, count=len(lines) + 1, offset=lines.offset * 4)
+    return lines.buffers()[2][offsets[0]: offsets[-1]]
+
+
+class SubmissionWriter:
+    """Appends (row_id, meter_reading) batches to a submission file, formatting chunk_rows
+    rows per task on workers threads; batches are written in the order they are given.
+
+        with SubmissionWriter('submission.csv') as writer:
+            for row_id, meter_reading in batches:
+                writer.write(row_id, meter_reading)
+    """
+
+    def __init__(self, path, decimals=4, chunk_rows=1 << 19, workers=None, compresslevel=6):
+        self.path = path
+        self.decimals = decimals
+        self.chunk_rows = chunk_rows
+        self.compresslevel = compresslevel if path.endswith('.gz') else None
+        self.pool = ThreadPoolExecutor(workers or os.cpu_count())
+        self.stream = open(path + '.tmp', 'wb')
+        self.stream.write(self._encode(HEADER))
+        self.rows = 0
+
+    def _encode(self, data):
+        return data if self.compresslevel is None else gzip.compress(data, self.compresslevel)
+
+    def _format(self, row_id, meter_reading):
+        return self._encode(format_rows(row_id, meter_reading, self.decimals))
+
+    def write(self, row_id, meter_reading):
+        row_id, meter_reading = np.asarray(row_id), np.asarray(meter_reading)
+        starts = range(0, len(row_id), self.chunk_rows)
+        chunks = self.pool.map(lambda start: self._format(row_id[start: start + self.chunk_rows],
+                                                          meter_reading[start: start + self.chunk_rows]), starts)
+        for chunk in chunks:
+            self.stream.write(chunk)
+        self.rows += len(row_id)
+
+    def close(self):
+        self.stream.close()
+        self.pool.shutdown()
+        os.replace(self.path + '.tmp', self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.stream.close()
+            self.pool.shutdown()
+
+
+def write_submission(path, row_id, meter_reading, decimals=4, workers=None, compresslevel=6):
+    with SubmissionWriter(path, decimals, workers=workers, compresslevel=compresslevel) as writer:
+        writer.write(row_id, meter_reading)
+    print('wrote {} rows to {}'.format(writer.rows, path))
+
+
+def cache_path(path, cache_dir=CACHE_DIR):
+    st = os.stat(path)
+    stamp = '{}:{}:{}'.format(os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    return os.path.join(cache_dir, 'submission-{}.npy'.format(hashlib.sha256(stamp.encode()).hexdigest()[:16]))
+
+
+def read_submission(path, out, cache_dir=CACHE_DIR):
+    """Fills out (float32, one entry per row_id) with the file's meter_reading; row_ids the
+    file does not have are NaN. The parsed column is cached, and read from the cache when
+    the file has not changed."""
+    cached = cache_path(path, cache_dir)
+    if os.path.exists(cached):
+        out[:] = np.load(cached, mmap_mode='r')
+        return out
+
+    table = csv.read_csv(path, convert_options=csv.ConvertOptions(
+        include_columns=['row_id', 'meter_reading'],
+        column_types={'row_id': pa.int64(), 'meter_reading': pa.float32()}))
+    row_id = table['row_id'].to_numpy()
+    if len(row_id) and (row_id.min() < 0 or row_id.max() >= len(out)):
+        raise ValueError('{}: row_id outside 0..{}'.format(path, len(out) - 1))
+    out[:] = np.nan
+    out[row_id] = table['meter_reading'].to_numpy(zero_copy_only=False)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cached + '.tmp', 'wb') as f:
+        np.save(f, out)
+    os.replace(cached + '.tmp', cached)
+    return out
+
+
+def read_submissions(paths, n_rows, workers=None, cache_dir=CACHE_DIR):
+    """(n_rows, len(paths)) float32 matrix of the files' meter_reading by row_id, read in
+    parallel; the matrix is column-major, so every file fills a contiguous column."""
+    preds = np.empty((n_rows, len(paths)), dtype=np.float32, order='F')
+    with ThreadPoolExecutor(workers or len(paths)) as pool:
+        list(pool.map(lambda i: read_submission(paths[i], preds[:, i], cache_dir), range(len(paths))))
+    return preds
@@ -0,0 +1,137 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import store
+
+# Deterministic ASHRAE-shaped data for benchmarks and smoke runs without the Kaggle inputs.
+# generate() returns the six competition tables with the dtypes store.load() gives, and
+# write_store() puts them where store.load(name, store_dir=...) finds them.
+#
+#     tables = generate(**SCALES['small'])
+#     write_store(tables, 'synthetic_store')
+
+PRIMARY_USES = ['Education', 'Entertainment/public assembly', 'Food sales and service', 'Healthcare',
+                'Lodging/residential', 'Manufacturing/industrial', 'Office', 'Other', 'Parking',
+                'Public services', 'Religious worship', 'Retail', 'Services', 'Technology/science',
+                'Utility', 'Warehouse/storage']
+# roughly the building_metadata.csv mix: mostly education and offices
+PRIMARY_USE_P = np.array([37, 10, 1, 2, 10, 1, 19, 2, 2, 11, 1, 1, 1, 1, 0.5, 0.5]) / 100
+
+# the share of buildings with each meter (electricity, chilledwater, steam, hotwater) in train.csv
+METER_RATES = (0.95, 0.34, 0.22, 0.10)
+
+WEATHER_COLUMNS = [('air_temperature', 15, 10), ('cloud_coverage', 2, 2), ('dew_temperature', 7, 9),
+                   ('precip_depth_1_hr', 1, 5), ('sea_level_pressure', 1016, 7), ('wind_direction', 180, 110),
+                   ('wind_speed', 3.5, 2.5)]
+
+SCALES = {
+    'small': dict(n_buildings=50, n_hours=24 * 28),
+    'medium': dict(n_buildings=200, n_hours=24 * 91),
+    'large': dict(n_buildings=1449, n_hours=8784),  # the full competition train set
+}
+
+HOURS_PER_YEAR = 8784  # 2016
+
+
+def _timestamps(first_hour, n_hours):
+    return store.EPOCH + np.arange(first_hour, first_hour + n_hours).astype('timedelta64[h]')
+
+
+def building_metadata(n_buildings, n_sites, rng):
+    floor_count = rng.randint(1, 20, n_buildings).astype(np.float32)
+    floor_count[rng.rand(n_buildings) < 0.75] = np.nan
+    year_built = rng.randint(1900, 2017, n_buildings).astype(np.float32)
+    year_built[rng.rand(n_buildings) < 0.5] = np.nan
+    primary_use = rng.choice(PRIMARY_USES, n_buildings, p=PRIMARY_USE_P)
+    return pd.DataFrame({
+        # building ids are grouped by site, as in the real file
+        'site_id': (np.arange(n_buildings) * n_sites // n_buildings).astype(np.int8),
+        'building_id': np.arange(n_buildings, dtype=np.int16),
+        'primary_use': pd.Categorical(primary_use, categories=sorted(set(primary_use))),
+        'square_feet': np.exp(rng.normal(11, 1, n_buildings)).astype(np.int32) + 300,
+        'year_built': year_built,
+        'floor_count': floor_count})
+
+
+def weather_readings(n_sites, first_hour, n_hours, missing_rate, rng):
+    """Hourly weather per site with a yearly and a daily cycle; missing_rate of the rows are
+    dropped and as many values per column set to NaN, as in weather_*.csv."""
+    hours = np.arange(first_hour, first_hour + n_hours)
+    season = -np.cos(2 * np.pi * hours / HOURS_PER_YEAR)
+    day = -np.cos(2 * np.pi * (hours % 24) / 24)
+    df = pd.DataFrame({'site_id': np.repeat(np.arange(n_sites, dtype=np.int8), n_hours),
+                       'timestamp': np.tile(_timestamps(first_hour, n_hours), n_sites)})
+    for col, mean, spread in WEATHER_COLUMNS:
+        values = mean + spread * rng.normal(0, 0.3, (n_sites, n_hours))
+        if col in ('air_temperature', 'dew_temperature'):
+            values += spread * (season + 0.3 * day) + rng.normal(0, 3, (n_sites, 1))
+        if col in ('cloud_coverage', 'precip_depth_1_hr', 'wind_speed'):
+            values = np.maximum(values, 0)
+        values = values.ravel().astype(np.float32)
+        values[rng.rand(len(values)) < missing_rate] = np.nan
+        df[col] = values
+    return df[rng.rand(len(df)) >= missing_rate].reset_index(drop=True)
+
+
+def meter_series(n_buildings, meter_rates, rng):
+    """(building_id, meter) pairs; every building has at least one meter."""
+    has_meter = rng.rand(n_buildings, 4) < np.array(meter_rates)
+    has_meter[~has_meter.any(axis=1), 0] = True
+    building, meter = np.nonzero(has_meter)
+    return building.astype(np.int16), meter.astype(np.int8)
+
+
+def meter_readings(building, meter, n_hours, zero_runs, rng):
+    """(n_series, n_hours) float32 readings with on average zero_runs runs of zeros per series and year."""
+    level = np.exp(rng.normal(4, 1.5, len(building)))[:, None]
+    daily = 1 + 0.3 * np.sin(2 * np.pi * (np.arange(n_hours) % 24) / 24)
+    readings = (level * daily * rng.lognormal(0, 0.2, (len(building), n_hours))).astype(np.float32)
+    n_runs = rng.poisson(zero_runs * len(building) * n_hours / HOURS_PER_YEAR)
+    series = rng.randint(0, len(building), n_runs)
+    starts = rng.randint(0, n_hours, n_runs)
+    lengths = rng.randint(1, 24 * 30, n_runs)
+    for s, start, length in zip(series, starts, lengths):
+        readings[s, start: start + length] = 0
+    return readings
+
+
+def generate(n_buildings=200, n_sites=16, n_hours=HOURS_PER_YEAR, missing_weather=0.05, zero_runs=2.0,
+             test_years=2, meter_rates=METER_RATES, seed=0):
+    """The ASHRAE tables for n_buildings over n_hours of train data starting 2016-01-01.
+
+    Test rows cover the same meters over test_years * n_hours hours from 2017-01-01;
+    missing_weather is the share of weather rows and values knocked out, zero_runs the
+    mean number of zero-reading runs (1 hour to 30 days) per train meter series and year,
+    and meter_rates the share of buildings with each of the four meters."""
+    rng = np.random.RandomState(seed)
+    buildings = building_metadata(n_buildings, n_sites, rng)
+    building, meter = meter_series(n_buildings, meter_rates, rng)
+    readings = meter_readings(building, meter, n_hours, zero_runs, rng)
+
+    # train.csv is ordered by timestamp, then building and meter
+    train = pd.DataFrame({'building_id': np.tile(building, n_hours),
+                          'meter': np.tile(meter, n_hours),
+                          'timestamp': np.repeat(_timestamps(0, n_hours), len(building)),
+                          'meter_reading': readings.T.ravel()})
+
+    # test.csv is ordered by building, meter, then timestamp
+    n_test_hours = test_years * n_hours
+    test = pd.DataFrame({'row_id': np.arange(len(building) * n_test_hours, dtype=np.int32),
+                         'building_id': np.repeat(building, n_test_hours),
+                         'meter': np.repeat(meter, n_test_hours),
+                         'timestamp': np.tile(_timestamps(HOURS_PER_YEAR, n_test_hours), len(building))})
+    sample_submission = pd.DataFrame({'row_id': test['row_id'].to_numpy(),
+                                      'meter_reading': np.zeros(len(test), dtype=np.float32)})
+    return {'train': train, 'test': test, 'building_metadata': buildings,
+            'weather_train': weather_readings(n_sites, 0, n_hours, missing_weather, rng),
+            'weather_test': weather_readings(n_sites, HOURS_PER_YEAR, n_test_hours, missing_weather, rng),
+            'sample_submission': sample_submission}
+
+
+def write_store(tables, store_dir=store.STORE_DIR):
+    """Writes the tables as store.convert() would, so store.load(name, store_dir=store_dir) reads them."""
+    os.makedirs(store_dir, exist_ok=True)
+    for name, df in tables.items():
+        df.to_feather(os.path.join(store_dir, name + '.feather'), compression='uncompressed')
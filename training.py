@@ -0,0 +1,54 @@
+import os
+import time
+
+import lightgbm as lgb
+import numpy as np
+
+from profiling import peak_rss_mb
+
+
+def cached_dataset(path, X=None, y=None, categorical='auto', params=None):
+    """Full training Dataset in LightGBM's binary format.
+
+    The first call bins X once and saves it to path; later runs (and every fold and
+    hyperparameter trial) load the binary file instead of rebuilding from pandas."""
+    if not os.path.exists(path):
+        start = time.time()
+        dataset = lgb.Dataset(X, label=y, categorical_feature=categorical, params=params, free_raw_data=True)
+        dataset.save_binary(path)
+        print('binned {} rows into {} in {:.0f}s, peak RSS {:.0f} MB'.format(
+            dataset.num_data(), path, time.time() - start, peak_rss_mb()))
+        return dataset
+    return lgb.Dataset(path, params=params).construct()
+
+
+def subset(dataset, indices):
+    # Dataset.subset() sorts its indices into a Python list, over 1 GB for a 20M-row fold;
+    # LightGBM takes a sorted int32 array just as well, so that is set directly
+    part = dataset.subset([])
+    part.used_indices = np.sort(np.asarray(indices)).astype(np.int32)
+    return part
+
+
+def train_folds(dataset, splits, param, num_rounds=20000, early_stopping_rounds=50, verbose_eval=25,
+                after_fold=None):
+    """Trains one booster per (train index, validation index) pair on subsets of dataset.
+
+    after_fold(fold, score) is called after every fold; returning True stops early,
+    which is how the hyperparameter search prunes trials. Returns the models and the
+    best validation score of every fold that ran."""
+    models, scores = [], []
+    for fold, (tr_idx, val_idx) in enumerate(splits):
+        start = time.time()
+        tr_data = subset(dataset, tr_idx)
+        vl_data = subset(dataset, val_idx)
+        clf = lgb.train(param, tr_data, num_rounds, valid_sets=[tr_data, vl_data], valid_names=['train', 'valid'],
+                        callbacks=[lgb.early_stopping(early_stopping_rounds), lgb.log_evaluation(verbose_eval)])
+        score = clf.best_score['valid'][param.get('metric', 'l2')]
+        print('fold {}: valid {} {:.5f}, {:.0f}s, peak RSS {:.0f} MB'.format(
+            fold, param.get('metric', 'l2'), score, time.time() - start, peak_rss_mb()))
+        models.append(clf)
+        scores.append(score)
+        if after_fold is not None and after_fold(fold, score):
+            break
+    return models, scores
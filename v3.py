@@ -2,15 +2,30 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import lightgbm as lgb
-from sklearn.preprocessing import LabelEncoder
 from sklearn.model_selection import KFold, StratifiedKFold, GroupKFold
 from tqdm import tqdm_notebook as tqdm
-import datetime
-from meteocalc import feels_like
 from sklearn import metrics
 import gc
 import os
-import joblib
+
+import cleaning
+import compact as compact_module
+import enrich
+import features as features_module
+import leakstore
+import store
+import weather
+from cache import StageCache
+from compact import compact
+from cleaning import find_bad_rows
+from enrich import JoinIndex
+from features import features_engineering
+from inference import predict_batches, predict_stream
+from profiling import Profiler
+from search import save_folds, search_process
+from submission import write_submission
+from training import cached_dataset, train_folds
+from weather import fill_weather_dataset
 
 from sklearn.feature_extraction.text import TfidfVectorizer
 
@@ -18,228 +33,50 @@ for dirname, _, filenames in os.walk('/kaggle/input'):
     for filename in filenames:
         print(os.path.join(dirname, filename))
 
-# checks if the saved processed train data doesn't exists. If does not, make the train data and save the file
-if not os.path.exists('processedTrain'):
-    # %% [code]
-    train_df = pd.read_csv('train.csv')
-    building_df = pd.read_csv('building_metadata.csv')
-    weather_df = pd.read_csv('weather_train.csv')
-    leak_df = pd.read_feather('leak.feather')
-    weather_test_df = pd.read_csv('weather_test.csv')
-    leak_df.fillna(0, inplace=True)
-    leak_df = leak_df[(leak_df.timestamp.dt.year > 2016) & (leak_df.timestamp.dt.year < 2019)]
-    leak_df.loc[leak_df.meter_reading < 0, 'meter_reading'] = 0  # remove large negative values
-    leak_df = leak_df[leak_df.building_id != 245]
-    leak_df = leak_df.reset_index(drop=True)
-
 # %% [code]
-# Original code from https://www.kaggle.com/aitude/ashrae-missing-weather-data-handling by @aitude
+# pipeline stages, cached by StageCache further down
 
-def fill_weather_dataset(weather_df):
-    # Find Missing Dates
-    time_format = "%Y-%m-%d %H:%M:%S"
-    start_date = datetime.datetime.strptime(weather_df['timestamp'].min(), time_format)
-    end_date = datetime.datetime.strptime(weather_df['timestamp'].max(), time_format)
-    total_hours = int(((end_date - start_date).total_seconds() + 3600) / 3600)
-    hours_list = [(end_date - datetime.timedelta(hours=x)).strftime(time_format) for x in range(total_hours)]
+def schema_path(name):
+    # dtypes picked on the first run are reused by later runs and by the test path
+    return os.path.join('cache', 'schemas', name + '.json')
 
-    missing_hours = []
-    for site_id in range(16):
-        site_hours = np.array(weather_df[weather_df['site_id'] == site_id]['timestamp'])
-        new_rows = pd.DataFrame(np.setdiff1d(hours_list, site_hours), columns=['timestamp'])
-        new_rows['site_id'] = site_id
-        weather_df = pd.concat([weather_df, new_rows])
 
-        weather_df = weather_df.reset_index(drop=True)
+def load_leak():
+    # 2017-2018 rows without the excluded buildings; leakstore.load zeroes NaN and negative readings
+    return leakstore.load(start_year=2017, end_year=2018)
 
-        # Add new Features
-    weather_df["datetime"] = pd.to_datetime(weather_df["timestamp"])
-    weather_df["day"] = weather_df["datetime"].dt.day
-    weather_df["week"] = weather_df["datetime"].dt.week
-    weather_df["month"] = weather_df["datetime"].dt.month
-
-    # Reset Index for Fast Update
-    weather_df = weather_df.set_index(['site_id', 'day', 'month'])
-
-    air_temperature_filler = pd.DataFrame(weather_df.groupby(['site_id', 'day', 'month'])['air_temperature'].mean(),
-                                          columns=["air_temperature"])
-    weather_df.update(air_temperature_filler, overwrite=False)
-
-    # Step 1
-    cloud_coverage_filler = weather_df.groupby(['site_id', 'day', 'month'])['cloud_coverage'].mean()
-    # Step 2
-    cloud_coverage_filler = pd.DataFrame(cloud_coverage_filler.fillna(method='ffill'), columns=["cloud_coverage"])
-
-    weather_df.update(cloud_coverage_filler, overwrite=False)
-
-    due_temperature_filler = pd.DataFrame(weather_df.groupby(['site_id', 'day', 'month'])['dew_temperature'].mean(),
-                                          columns=["dew_temperature"])
-    weather_df.update(due_temperature_filler, overwrite=False)
-
-    # Step 1
-    sea_level_filler = weather_df.groupby(['site_id', 'day', 'month'])['sea_level_pressure'].mean()
-    # Step 2
-    sea_level_filler = pd.DataFrame(sea_level_filler.fillna(method='ffill'), columns=['sea_level_pressure'])
-
-    weather_df.update(sea_level_filler, overwrite=False)
-
-    wind_direction_filler = pd.DataFrame(weather_df.groupby(['site_id', 'day', 'month'])['wind_direction'].mean(),
-                                         columns=['wind_direction'])
-    weather_df.update(wind_direction_filler, overwrite=False)
-
-    wind_speed_filler = pd.DataFrame(weather_df.groupby(['site_id', 'day', 'month'])['wind_speed'].mean(),
-                                     columns=['wind_speed'])
-    weather_df.update(wind_speed_filler, overwrite=False)
-
-    # Step 1
-    precip_depth_filler = weather_df.groupby(['site_id', 'day', 'month'])['precip_depth_1_hr'].mean()
-    # Step 2
-    precip_depth_filler = pd.DataFrame(precip_depth_filler.fillna(method='ffill'), columns=['precip_depth_1_hr'])
-
-    weather_df.update(precip_depth_filler, overwrite=False)
-
-    weather_df = weather_df.reset_index()
-    weather_df = weather_df.drop(['datetime', 'day', 'week', 'month'], axis=1)
-
-    def get_meteorological_features(data):
-        def calculate_rh(df):
-            df['relative_humidity'] = 100 * (
-                        np.exp((17.625 * df['dew_temperature']) / (243.04 + df['dew_temperature'])) / np.exp(
-                    (17.625 * df['air_temperature']) / (243.04 + df['air_temperature'])))
-
-        def calculate_fl(df):
-            flike_final = []
-            flike = []
-            # calculate Feels Like temperature
-            for i in range(len(df)):
-                at = df['air_temperature'][i]
-                rh = df['relative_humidity'][i]
-                ws = df['wind_speed'][i]
-                flike.append(feels_like(at, rh, ws))
-            for i in range(len(flike)):
-                flike_final.append(flike[i].f)
-            df['feels_like'] = flike_final
-            del flike_final, flike, at, rh, ws
-
-        calculate_rh(data)
-        calculate_fl(data)
-        return data
-
-    weather_df = get_meteorological_features(weather_df)
-
-    return weather_df
-
-
-# Original code from https://www.kaggle.com/gemartin/load-data-reduce-memory-usage by @gemartin
-
-from pandas.api.types import is_datetime64_any_dtype as is_datetime
-from pandas.api.types import is_categorical_dtype
-
-
-def reduce_mem_usage(df, use_float16=False):
-    """
-    Iterate through all the columns of a dataframe and modify the data type to reduce memory usage.
-    """
-
-    start_mem = df.memory_usage().sum() / 1024 ** 2
-    print("Memory usage of dataframe is {:.2f} MB".format(start_mem))
-
-    for col in df.columns:
-        if is_datetime(df[col]) or is_categorical_dtype(df[col]):
-            continue
-        col_type = df[col].dtype
-
-        if col_type != object:
-            c_min = df[col].min()
-            c_max = df[col].max()
-            if str(col_type)[:3] == "int":
-                if c_min > np.iinfo(np.int8).min and c_max < np.iinfo(np.int8).max:
-                    df[col] = df[col].astype(np.int8)
-                elif c_min > np.iinfo(np.int16).min and c_max < np.iinfo(np.int16).max:
-                    df[col] = df[col].astype(np.int16)
-                elif c_min > np.iinfo(np.int32).min and c_max < np.iinfo(np.int32).max:
-                    df[col] = df[col].astype(np.int32)
-                elif c_min > np.iinfo(np.int64).min and c_max < np.iinfo(np.int64).max:
-                    df[col] = df[col].astype(np.int64)
-            else:
-                if use_float16 and c_min > np.finfo(np.float16).min and c_max < np.finfo(np.float16).max:
-                    df[col] = df[col].astype(np.float16)
-                elif c_min > np.finfo(np.float32).min and c_max < np.finfo(np.float32).max:
-                    df[col] = df[col].astype(np.float32)
-                else:
-                    df[col] = df[col].astype(np.float64)
-        else:
-            df[col] = df[col].astype("category")
-
-    end_mem = df.memory_usage().sum() / 1024 ** 2
-    print("Memory usage after optimization is: {:.2f} MB".format(end_mem))
-    print("Decreased by {:.1f}%".format(100 * (start_mem - end_mem) / start_mem))
-
-    return df
-
-
-def features_engineering(df):
-    # Sort by timestamp
-    df.sort_values("timestamp")
-    df.reset_index(drop=True)
-
-    # Add more features
-    df["timestamp"] = pd.to_datetime(df["timestamp"], format="%Y-%m-%d %H:%M:%S")
-    df["hour"] = df["timestamp"].dt.hour
-    df["weekend"] = df["timestamp"].dt.weekday
-    holidays = ["2016-01-01", "2016-01-18", "2016-02-15", "2016-05-30", "2016-07-04",
-                "2016-09-05", "2016-10-10", "2016-11-11", "2016-11-24", "2016-12-26",
-                "2017-01-02", "2017-01-16", "2017-02-20", "2017-05-29", "2017-07-04",
-                "2017-09-04", "2017-10-09", "2017-11-10", "2017-11-23", "2017-12-25",
-                "2018-01-01", "2018-01-15", "2018-02-19", "2018-05-28", "2018-07-04",
-                "2018-09-03", "2018-10-08", "2018-11-12", "2018-11-22", "2018-12-25",
-                "2019-01-01"]
-    df['group'] = df['timestamp'].dt.month
-    df['group'].replace((1, 2, 3, 4), 1, inplace=True)
-    df['group'].replace((5, 6, 7, 8), 2, inplace=True)
-    df['group'].replace((9, 10, 11, 12), 3, inplace=True)
-    df["is_holiday"] = (df.timestamp.isin(holidays)).astype(int)
-    df['square_feet'] = np.log1p(df['square_feet'])
-
-    # Remove Unused Columns
-    drop = ["timestamp"]
-    df = df.drop(drop, axis=1)
-    gc.collect()
 
-    # Encode Categorical Data
-    le = LabelEncoder()
-    df["primary_use"] = le.fit_transform(df["primary_use"])
-
-    return df
-
-
-if not os.path.exists('processedTrain'):
-    # %% [code]
-    # weather manipulation
-    weather_df = fill_weather_dataset(weather_df)
-    weather_test_df = fill_weather_dataset(weather_test_df)
-
-    # memory reduction
-    train_df = reduce_mem_usage(train_df, use_float16=True)
-    building_df = reduce_mem_usage(building_df, use_float16=True)
-    weather_df = reduce_mem_usage(weather_df, use_float16=True)
-    leak_df = reduce_mem_usage(leak_df, use_float16=True)
-    weather_test_df = reduce_mem_usage(weather_test_df, use_float16=True)
-    leak_df['timestamp'] = leak_df['timestamp'].dt.strftime("%Y-%m-%d %H:%M:%S")
-
-    # merge data
-    train_df = train_df.merge(building_df, left_on='building_id', right_on='building_id', how='left')
-    train_df = train_df.merge(weather_df, how='left', left_on=['site_id', 'timestamp'], right_on=['site_id', 'timestamp'])
-    leak_df = leak_df.merge(building_df, left_on='building_id', right_on='building_id', how='left')
-    leak_df = leak_df.merge(weather_test_df, how='left', left_on=['site_id', 'timestamp'], right_on=['site_id', 'timestamp'])
-    #leak_df = train_df.merge(weather_df, how='left', left_on=['site_id', 'timestamp'], right_on=['site_id', 'timestamp'])
+def prepare_weather(table):
+    # weather manipulation and memory reduction
+    return compact(fill_weather_dataset(store.load(table)), schema_path(table), float16=True)
+
+
+def merge_train(weather_df, weather_test_df):
+    train_df = compact(store.load('train', hours=True), schema_path('train'), float16=True)
+    building_df = compact(store.load('building_metadata'), schema_path('building_metadata'), float16=True)
+    leak_df = load_leak()
+    leak_df['timestamp'] = store.to_hours(leak_df['timestamp'])
+    # same columns as train, so the same dtypes and the concat below does not upcast
+    leak_df = compact(leak_df, schema_path('train'))
+
+    # add building and weather columns by direct (building_id) and (site_id, hour) lookups
+    train_df = JoinIndex(building_df, weather_df).enrich(train_df)
+    leak_df = JoinIndex(building_df, weather_test_df).enrich(leak_df)
     del weather_df
     gc.collect()
 
     # append processed leaked data to train data
-    train_df = train_df.append(leak_df, ignore_index=True)
+    return pd.concat([train_df, leak_df], ignore_index=True)
+
+
+def remove_bad_rows(train_df):
+    # the first len(train.csv) rows of the merged frame line up with the rows of X
+    X, y = combined_train_data()
+    bad_rows = find_bad_rows(X, y)
+    return train_df.drop(bad_rows).reset_index(drop=True)
+
 
-    # feature engineering
+def engineer_features(train_df):
     train_df = features_engineering(train_df)
 
     # transform target variable
@@ -247,41 +84,24 @@ if not os.path.exists('processedTrain'):
 
     # reduce float64 to float32
     train_df['square_feet'] = train_df['square_feet'].astype('float32')
-
-    site_GMT_offsets = [-5, 0, -7, -5, -8, 0, -5, -5, -5, -6, -7, -5, 0, -6, -5, -5]
+    return train_df
 
 
-# %% [code]
-def compress_dataframe(df):
-    result = df.copy()
-    for col in result.columns:
-        col_data = result[col]
-        dn = col_data.dtype.name
-        if dn == "object":
-            result[col] = pd.to_numeric(col_data.astype("category").cat.codes, downcast="integer")
-        elif dn == "bool":
-            result[col] = col_data.astype("int8")
-        elif dn.startswith("int") or (col_data.round() == col_data).all():
-            result[col] = pd.to_numeric(col_data, downcast="integer")
-        else:
-            result[col] = pd.to_numeric(col_data, downcast='float')
-    return result
+site_GMT_offsets = [-5, 0, -7, -5, -8, 0, -5, -5, -5, -6, -7, -5, 0, -6, -5, -5]
 
 
+# %% [code]
 def read_train():
-    df = pd.read_csv('train.csv', parse_dates=["timestamp"])
-    df.timestamp = (df.timestamp - pd.to_datetime("2016-01-01")).dt.total_seconds() // 3600
-    return compress_dataframe(df)
+    return compact(store.load('train', hours=True), schema_path('train-int'), integers=True)
 
 
 def read_building_metadata():
-    return compress_dataframe(
-        pd.read_csv('building_metadata.csv').fillna(-1)).set_index("building_id")
+    return compact(store.load('building_metadata').fillna({'year_built': -1, 'floor_count': -1}),
+                   schema_path('building_metadata-int'), integers=True).set_index("building_id")
 
 
 def read_weather_train(fix_timestamps=True, interpolate_na=True, add_na_indicators=True):
-    df = pd.read_csv('weather_train.csv', parse_dates=["timestamp"])
-    df.timestamp = (df.timestamp - pd.to_datetime("2016-01-01")).dt.total_seconds() // 3600
+    df = store.load('weather_train', hours=True)
     if fix_timestamps:
         GMT_offset_map = {site: offset for site, offset in enumerate(site_GMT_offsets)}
         df.timestamp = df.timestamp + df.site_id.map(GMT_offset_map)
@@ -301,91 +121,38 @@ def read_weather_train(fix_timestamps=True, interpolate_na=True, add_na_indicato
     elif add_na_indicators:
         for col in df.columns:
             if df[col].isna().any(): df[f"had_{col}"] = ~df[col].isna()
-    return compress_dataframe(df).set_index(["site_id", "timestamp"])
-
-
-def find_bad_zeros(X, y):
-    """Returns an Index object containing only the rows which should be deleted."""
-    Xy = X.assign(meter_reading=y, meter_id=X.meter)
-    is_bad_zero = Xy.groupby(["building_id", "meter"]).apply(make_is_bad_zero)
-    return is_bad_zero[is_bad_zero].index.droplevel([0, 1])
-
-
-def find_bad_sitezero(X):
-    """Returns indices of bad rows from the early days of Site 0 (UCF)."""
-    return X[(X.timestamp < 3378) & (X.site_id == 0) & (X.meter == 0)].index
-
-
-def find_bad_building1099(X, y):
-    """Returns indices of bad rows (with absurdly high readings) from building 1099."""
-    return X[(X.building_id == 1099) & (X.meter == 2) & (y > 3e4)].index
+    return compact(df, schema_path('weather_train-int'), integers=True).set_index(["site_id", "timestamp"])
 
 
 def combined_train_data(fix_timestamps=True, interpolate_na=True, add_na_indicators=True):
-    Xy = compress_dataframe(read_train().join(read_building_metadata(), on="building_id").join(
+    Xy = compact(read_train().join(read_building_metadata(), on="building_id").join(
         read_weather_train(fix_timestamps, interpolate_na, add_na_indicators),
-        on=["site_id", "timestamp"]).fillna(-1))
+        on=["site_id", "timestamp"]).fillna(-1), schema_path('combined-int'), integers=True)
     return Xy.drop(columns=["meter_reading"]), Xy.meter_reading
 
 
+# %% [code]
+# per-stage wall/cpu time, peak RSS and row counts go to profiles/v3-<start>.json at the end of the run;
+# Profiler('v3', sample_interval=0.01) also writes sampled stacks for a flame graph
+profiler = Profiler('v3')
+
+# each stage only reruns when its inputs, its code or anything upstream of it changes
+cache = StageCache('cache')
+leak_partitions = [leakstore.partition_path(site_id) for site_id in leakstore.stored_sites()]
+cache.stage('weather_train', profiler.wrap(prepare_weather, 'weather_train'), inputs=['weather_train.csv'],
+            deps=[weather, store, compact_module], table='weather_train')
+cache.stage('weather_test', profiler.wrap(prepare_weather, 'weather_test'), inputs=['weather_test.csv'],
+            deps=[weather, store, compact_module], table='weather_test')
+cache.stage('merged', profiler.wrap(merge_train), inputs=['train.csv', 'building_metadata.csv'] + leak_partitions,
+            after=['weather_train', 'weather_test'], deps=[store, enrich, leakstore, compact_module, load_leak])
+cache.stage('cleaned', profiler.wrap(remove_bad_rows), inputs=['train.csv', 'building_metadata.csv', 'weather_train.csv'],
+            after=['merged'], deps=[cleaning, store, combined_train_data, read_train, read_building_metadata,
+                                    read_weather_train, compact_module])
+cache.stage('features', profiler.wrap(engineer_features), after=['cleaned'], deps=[features_module])
+with profiler.stage('train pipeline') as record:
+    train_df = cache.get('features')  # cache hits only show up as load time here
+    record['rows_out'] = len(train_df)
 
-
-
-def make_is_bad_zero(Xy_subset, min_interval=48, summer_start=3000, summer_end=7500):
-    """Helper routine for 'find_bad_zeros'.
-    This operates upon a single dataframe produced by 'groupby'. We expect an
-    additional column 'meter_id' which is a duplicate of 'meter' because groupby
-    eliminates the original one."""
-    meter = Xy_subset.meter_id.iloc[0]
-    is_zero = Xy_subset.meter_reading == 0
-    if meter == 0:
-        # Electrical meters should never be zero. Keep all zero-readings in this table so that
-        # they will all be dropped in the train set.
-        return is_zero
-
-    transitions = (is_zero != is_zero.shift(1))
-    all_sequence_ids = transitions.cumsum()
-    ids = all_sequence_ids[is_zero].rename("ids")
-    if meter in [2, 3]:
-        # It's normal for steam and hotwater to be turned off during the summer
-        keep = set(ids[(Xy_subset.timestamp < summer_start) |
-                       (Xy_subset.timestamp > summer_end)].unique())
-        is_bad = ids.isin(keep) & (ids.map(ids.value_counts()) >= min_interval)
-    elif meter == 1:
-        time_ids = ids.to_frame().join(Xy_subset.timestamp).set_index("timestamp").ids
-        is_bad = ids.map(ids.value_counts()) >= min_interval
-
-        # Cold water may be turned off during the winter
-        jan_id = time_ids.get(0, False)
-        dec_id = time_ids.get(8283, False)
-        if (jan_id and dec_id and jan_id == time_ids.get(500, False) and
-                dec_id == time_ids.get(8783, False)):
-            is_bad = is_bad & (~(ids.isin(set([jan_id, dec_id]))))
-    else:
-        raise Exception(f"Unexpected meter type: {meter}")
-
-    result = is_zero.copy()
-    result.update(is_bad)
-    return result
-
-
-def find_bad_rows(X, y):
-    return find_bad_zeros(X, y).union(find_bad_sitezero(X)).union(find_bad_building1099(X, y))
-
-
-if os.path.exists('processedTrain'):
-    train_df = joblib.load('processedTrain')
-else:
-    X, y = combined_train_data()
-    # %% [code]
-    # eliminate bad rows
-    bad_rows = find_bad_rows(X, y)
-    bad_rows = bad_rows.sort_values()
-    bad_rows = pd.DataFrame(bad_rows)
-    bad_rows = list(bad_rows[0])
-    train_df.drop(bad_rows, inplace=True)
-    train_df.reset_index(drop=True, inplace=True)
-    joblib.dump(train_df, 'processedTrain')  # saves the train data as file
 # %% [code] {"scrolled":false}
 # declare target, categorical and numeric columns
 target = 'meter_reading'
@@ -395,7 +162,19 @@ features = categorical + numeric_cols
 
 
 # %% [code] {"scrolled":false}
-def run_lgbm(train, cat_features=categorical, num_rounds=20000, folds=3):
+lgbm_params = {'num_leaves': 500,
+               'objective': 'regression',
+               'learning_rate': 0.05,
+               'boosting': 'gbdt',
+               'subsample': 0.4,
+               'feature_fraction': 0.7,
+               'n_jobs': -1,
+               'seed': 50,
+               'metric': 'rmse'
+               }
+
+
+def run_lgbm(train, cat_features=categorical, num_rounds=20000, folds=3, dataset_path=None, param=None):
     kf = GroupKFold(n_splits=folds)
     models = []
     #     param = {"objective": "regression",
@@ -407,79 +186,94 @@ def run_lgbm(train, cat_features=categorical, num_rounds=20000, folds=3):
     #              "metric": "rmse"
     #             }
 
-    param = {'num_leaves': 500,
-             'objective': 'regression',
-             'learning_rate': 0.05,
-             'boosting': 'gbdt',
-             'subsample': 0.4,
-             'feature_fraction': 0.7,
-             'n_jobs': -1,
-             'seed': 50,
-             'metric': 'rmse'
-             }
+    if param is None:
+        param = lgbm_params
     oof = np.zeros(len(train))
-    for tr_idx, val_idx in tqdm(kf.split(train, groups=train['group']), total=folds):
-        tr_x, tr_y = train[features].iloc[tr_idx], train[target].iloc[tr_idx]
-        vl_x, vl_y = train[features].iloc[val_idx], train[target].iloc[val_idx]
-        tr_data = lgb.Dataset(tr_x, label=tr_y, categorical_feature=categorical)
-        vl_data = lgb.Dataset(vl_x, label=vl_y, categorical_feature=categorical)
-        clf = lgb.train(param, tr_data, num_rounds, valid_sets=[tr_data, vl_data], verbose_eval=25,
-                        early_stopping_rounds=50)
-        models.append(clf)
-        oof[val_idx] = clf.predict(vl_x)
+    if dataset_path is not None:
+        # bin the full matrix once (or load it from an earlier run) and train every fold on index subsets
+        splits = list(kf.split(train, groups=train['group']))
+        if os.path.exists(dataset_path):
+            dataset = cached_dataset(dataset_path)  # no copy of the feature matrix needed
+        else:
+            dataset = cached_dataset(dataset_path, train[features], train[target], cat_features)
+        models, _ = train_folds(dataset, splits, param, num_rounds)
+        for clf, (_, val_idx) in zip(models, splits):
+            oof[val_idx] = clf.predict(train.iloc[val_idx][features])
         gc.collect()
+    else:
+        for tr_idx, val_idx in tqdm(kf.split(train, groups=train['group']), total=folds):
+            tr_x, tr_y = train[features].iloc[tr_idx], train[target].iloc[tr_idx]
+            vl_x, vl_y = train[features].iloc[val_idx], train[target].iloc[val_idx]
+            tr_data = lgb.Dataset(tr_x, label=tr_y, categorical_feature=categorical)
+            vl_data = lgb.Dataset(vl_x, label=vl_y, categorical_feature=categorical)
+            clf = lgb.train(param, tr_data, num_rounds, valid_sets=[tr_data, vl_data], verbose_eval=25,
+                            early_stopping_rounds=50)
+            models.append(clf)
+            oof[val_idx] = clf.predict(vl_x)
+            gc.collect()
     score = np.sqrt(metrics.mean_squared_error(train[target], np.clip(oof, a_min=0, a_max=None)))
     print('Our oof cv is :', score)
     return models
 
 
-models = run_lgbm(train_df)
+# the binned Dataset is keyed on the cached feature stage, so it is rebuilt only when the features change
+dataset_path = os.path.join('cache', 'train-{}.bin'.format(cache.stages['features']['key']))
+
+# optional random search over the lgbm parameters; trials share the binned Dataset and
+# their results are kept in cache/, so rerunning the cell resumes an interrupted search
+tune_params = False
+if tune_params:
+    search_space = {'num_leaves': (64, 1280),
+                    'learning_rate': (0.02, 0.1),
+                    'feature_fraction': (0.5, 0.9),
+                    'subsample': (0.3, 0.9),
+                    'reg_lambda': [0, 1, 2, 5]}
+    splits = list(GroupKFold(n_splits=3).split(train_df, groups=train_df['group']))
+    if not os.path.exists(dataset_path):
+        cached_dataset(dataset_path, train_df[features], train_df[target], categorical)
+    folds_path = dataset_path[:-len('.bin')] + '-folds.npy'
+    save_folds(folds_path, splits, len(train_df))
+    # in a process of its own: the spawned trial workers re-import __main__, which would rerun this script
+    best = profiler.wrap(search_process)(search_space, dataset_path, folds_path, lgbm_params, n_trials=20,
+                                         workers=2, threads_per_trial=max(1, os.cpu_count() // 2),
+                                         results_path=os.path.join('cache', 'search-{}.jsonl'.format(
+                                             cache.stages['features']['key'])))
+    print('best trial:', best['score'], best['params'])
+    lgbm_params = dict(best['params'], num_threads=0)  # 0: back to all cores for the final run
+
+models = profiler.wrap(run_lgbm, 'train')(train_df, dataset_path=dataset_path)
 
 # %% [code]
-# read test
-test_df = pd.read_csv('test.csv')
-row_ids = test_df["row_id"]
-test_df.drop("row_id", axis=1, inplace=True)
-test_df = reduce_mem_usage(test_df)
-building_df = pd.read_csv('building_metadata.csv')
-building_df = reduce_mem_usage(building_df, use_float16=True)
-
-# merge with building info
-test_df = test_df.merge(building_df, left_on='building_id', right_on='building_id', how='left')
-del building_df
-gc.collect()
-
 # fill test weather data
-weather_df = pd.read_csv('weather_test.csv')
-weather_df = fill_weather_dataset(weather_df)
-weather_df = reduce_mem_usage(weather_df)
-
-# merge weather data
-test_df = test_df.merge(weather_df, how='left', on=['timestamp', 'site_id'])
-del weather_df
-gc.collect()
-
-# feature engineering
-test_df = features_engineering(test_df)
+weather_test_df = cache.get('weather_test')
+building_df = compact(store.load('building_metadata'), schema_path('building_metadata'))
 
 
 # %% [code]
 def predictions(models, iterations=50):
-    # split test data into batches
-    set_size = len(test_df)
-    batch_size = set_size // iterations
-    meter_reading = []
-    for i in tqdm(range(iterations)):
-        pos = i * batch_size
-        fold_preds = [np.expm1(model.predict(test_df[features].iloc[pos: pos + batch_size])) for model in models]
-        meter_reading.extend(np.mean(fold_preds, axis=0))
-
-    print(len(meter_reading))
-    assert len(meter_reading) == set_size
-    submission = pd.read_csv('sample_submission.csv')
-    submission['meter_reading'] = np.clip(meter_reading, a_min=0, a_max=None)  # clip min at zero
-    submission.to_csv('submission.csv', index=False)
+    # whole test set in memory: read, merge and engineer everything, then predict in batches
+    test_df = store.load('test', columns=['building_id', 'meter', 'timestamp'], hours=True)
+    test_df = JoinIndex(building_df, weather_test_df).enrich(test_df)
+    test_df = features_engineering(test_df)
+
+    meter_reading = predict_batches(models, test_df[features], iterations, workers=predict_workers,
+                                    batch_rows=predict_batch_rows, predict_threads=predict_threads)
+    row_id = store.load('sample_submission', columns=['row_id'])['row_id']
+    write_submission('submission.csv', row_id, np.clip(meter_reading, a_min=0, a_max=None))  # clip min at zero
     print('We are done!')
 
 
-predictions(models)
+# fold models are evaluated on a thread pool; the averaged predictions match the serial run exactly
+predict_workers = os.cpu_count()
+predict_batch_rows = 100000  # rows per predict call
+predict_threads = None  # lightgbm threads per predict call; None splits the cores between the workers
+
+# streaming keeps peak memory at a few chunks of test rows instead of the full 41M-row frame
+stream_test = True
+with profiler.stage('predict'):
+    if stream_test:
+        predict_stream(models, features, weather_test_df, building_df, chunk_rows=1000000, workers=predict_workers,
+                       batch_rows=predict_batch_rows, predict_threads=predict_threads)
+    else:
+        predictions(models)
+profiler.write()
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype as is_datetime
+
+
+# Vectorized versions of meteocalc's heat_index / wind_chill / feels_like.
+# Same NOAA formulas and branch logic, but array-in/array-out so the weather
+# frame never gets walked row by row. Temperatures are taken as Fahrenheit and
+# wind speed as mph, exactly like meteocalc does for plain floats.
+
+def relative_humidity(air_temperature, dew_temperature):
+    air_temperature = np.asarray(air_temperature, dtype=np.float64)
+    dew_temperature = np.asarray(dew_temperature, dtype=np.float64)
+    return 100 * (np.exp((17.625 * dew_temperature) / (243.04 + dew_temperature)) /
+                  np.exp((17.625 * air_temperature) / (243.04 + air_temperature)))
+
+
+def heat_index(temperature, humidity):
+    T = np.asarray(temperature, dtype=np.float64)
+    RH = np.asarray(humidity, dtype=np.float64)
+
+    # simplified formula first, Rothfusz regression wherever that gives >= 80
+    simple = 0.5 * (T + 61. + (T - 68.) * 1.2 + RH * 0.094)
+    rothfusz = (-42.379 + 2.04901523 * T + 10.14333127 * RH - 0.22475541 * T * RH
+                - 6.83783e-3 * T ** 2 - 5.481717e-2 * RH ** 2 + 1.22874e-3 * T ** 2 * RH
+                + 8.5282e-4 * T * RH ** 2 - 1.99e-6 * T ** 2 * RH ** 2)
+    return np.where(simple >= 80, rothfusz, simple)
+
+
+def wind_chill(temperature, wind_speed):
+    T = np.asarray(temperature, dtype=np.float64)
+    V = np.asarray(wind_speed, dtype=np.float64) ** 0.16
+    return 35.74 + (0.6215 * T) - 35.75 * V + 0.4275 * T * V
+
+
+def feels_like(temperature, humidity, wind_speed):
+    T = np.asarray(temperature, dtype=np.float64)
+    RH = np.asarray(humidity, dtype=np.float64)
+    V = np.asarray(wind_speed, dtype=np.float64)
+
+    # meteocalc picks wind chill first, then heat index, else the temperature itself.
+    # NaNs fail both comparisons and fall through to T, same as the scalar version.
+    is_chill = (T <= 50) & (V > 3)
+    is_heat = ~is_chill & (T >= 80)
+    with np.errstate(invalid='ignore'):
+        result = np.where(is_chill, wind_chill(T, V), T)
+    return np.where(is_heat, heat_index(T, RH), result)
+
+
+def get_meteorological_features(df):
+    """Adds relative_humidity and feels_like columns in one pass over the weather columns."""
+    air_temperature = df['air_temperature'].to_numpy(dtype=np.float64, na_value=np.nan)
+    dew_temperature = df['dew_temperature'].to_numpy(dtype=np.float64, na_value=np.nan)
+    wind_speed = df['wind_speed'].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    rh = relative_humidity(air_temperature, dew_temperature)
+    df['relative_humidity'] = rh
+    df['feels_like'] = feels_like(air_temperature, rh, wind_speed)
+    return df
+
+
+# Original code from https://www.kaggle.com/aitude/ashrae-missing-weather-data-handling by @aitude
+# Rewritten to build the site x hour grid with a single reindex and fill every column
+# from one grouped aggregation instead of one groupby/update pass per column.
+
+MEAN_FILL_COLUMNS = ['air_temperature', 'dew_temperature', 'wind_direction', 'wind_speed']
+FFILL_COLUMNS = ['cloud_coverage', 'sea_level_pressure', 'precip_depth_1_hr']
+
+
+def fill_weather_dataset(weather_df, n_sites=16):
+    # timestamps come back in whatever form they went in: datetimes or "%Y-%m-%d %H:%M:%S" strings
+    time_format = "%Y-%m-%d %H:%M:%S"
+    as_strings = not is_datetime(weather_df['timestamp'])
+    timestamps = pd.to_datetime(weather_df['timestamp'], format=time_format if as_strings else None)
+    hours = pd.date_range(timestamps.min(), timestamps.max(), freq=pd.Timedelta(hours=1))
+    sites = np.union1d(np.arange(n_sites), weather_df['site_id'].unique())
+
+    # Find missing dates: every site gets every hour between the first and last reading
+    grid = pd.MultiIndex.from_product([sites, hours], names=['site_id', 'datetime'])
+    weather_df = (weather_df.drop(columns='timestamp')
+                  .assign(datetime=timestamps.values)
+                  .drop_duplicates(['site_id', 'datetime'])
+                  .set_index(['site_id', 'datetime'])
+                  .reindex(grid)
+                  .reset_index()
+                  .drop(columns='datetime'))
+    labels = hours.strftime(time_format) if as_strings else hours
+    weather_df.insert(1, 'timestamp', np.tile(labels, len(sites)))
+
+    # fillers are the (site, day, month) means; groups are numbered in the same
+    # sorted order groupby used so the forward fill crosses groups identically
+    day = np.tile(hours.day.values, len(sites))
+    month = np.tile(hours.month.values, len(sites))
+    site = np.repeat(np.arange(len(sites)), len(hours))
+    _, group = np.unique((site * 32 + day) * 13 + month, return_inverse=True)
+
+    mean_cols = [c for c in MEAN_FILL_COLUMNS if c in weather_df.columns]
+    ffill_cols = [c for c in FFILL_COLUMNS if c in weather_df.columns]
+    fillers = weather_df[mean_cols + ffill_cols].groupby(group).mean()
+    fillers[ffill_cols] = fillers[ffill_cols].ffill()
+    fill_values = pd.DataFrame(fillers.to_numpy()[group], columns=fillers.columns, index=weather_df.index)
+    weather_df[fillers.columns] = weather_df[fillers.columns].fillna(fill_values)
+
+    return get_meteorological_features(weather_df)